@@ -1,10 +1,13 @@
 #include "Nicla_System.h"
 #include "Arduino_BHY2.h"
 #include <ArduinoBLE.h>
+#include "sensor_packet.h"
 
 #define PACKET_SIZE 130  // Define the maximum BLE packet size
 #define BLE_SENSE_UUID(val) ("19b10000-" val "-537e-4f6c-d104768a1214")
 #define SERIAL_DEBUG 1
+#define BINARY_PACKETS 1      // 1: binary packets (sensor_packet.h), 0: legacy text packets
+#define SAMPLES_PER_PACKET 1  // samples batched into one binary notification, up to SENSOR_PACKET_MAX_SAMPLES
 
 const int VERSION = 0x00000000;
 int batteryLevel = 0;
@@ -17,6 +20,9 @@ byte programStatus = 0;
 uint32_t packet_id = 0;  // Initialize id for redundancy check
 bool startSaving = 1;
 
+sensor_packet_t sensorPacket;        // binary packet being filled
+unsigned long firstSampleMillis = 0; // time of the first sample of the packet
+
 BLEService service(BLE_SENSE_UUID("0000"));
 BLEUnsignedIntCharacteristic versionCharacteristic(BLE_SENSE_UUID("1001"), BLERead);
 BLECharacteristic dataCharacteristic(BLE_SENSE_UUID("A001"), BLERead | BLENotify, PACKET_SIZE); // One characteristic for all data
@@ -126,6 +132,27 @@ void loop() {
         unsigned int gValue = gas.value();
         uint8_t battLevel = nicla::getBatteryVoltagePercentage();
 
+#if BINARY_PACKETS
+        uint8_t count = sensorPacket.sample_count;
+        if (count == 0) firstSampleMillis = millis();
+        sensor_sample_t &sample = sensorPacket.samples[count];
+        sample.packet_id = packet_id;
+        sample.temperature_centi = (int16_t)lroundf(tempValue * 100.0f);
+        sample.humidity = humValue;
+        sample.pressure_deci = (uint16_t)lroundf(pressureValue * 10.0f);
+        sample.iaq_centi = (uint16_t)lroundf(airQuality * 100.0f);
+        sample.co2 = co2;
+        sample.gas = gValue;
+        sample.battery = battLevel;
+        sensorPacket.sample_count = ++count;
+
+        if (count >= SAMPLES_PER_PACKET){
+          sensorPacket.version = SENSOR_PACKET_VERSION;
+          sensorPacket.sample_interval_ms = count > 1 ? (millis() - firstSampleMillis) / (count - 1) : 0;
+          dataCharacteristic.writeValue((const uint8_t *)&sensorPacket, SENSOR_PACKET_SIZE(count));
+          sensorPacket.sample_count = 0;
+        }
+#else
         char dataPacket[PACKET_SIZE];
         snprintf(dataPacket, sizeof(dataPacket),
                 "%d,T:%.2f,H:%d,P:%.2f,IAQ:%.2f,CO2:%d,Gas:%d,Batt:%d",
@@ -133,6 +160,7 @@ void loop() {
                 airQuality, co2, gValue, battLevel);
 
         dataCharacteristic.writeValue(dataPacket);
+#endif
     
         packet_id++;
       }
@@ -0,0 +1,47 @@
+// Binary layout of the sensor data notifications, shared with the hub (Raspberry/sensor_packet.py).
+// All fields are little-endian and packed. Any change to the layout must bump SENSOR_PACKET_VERSION
+// and be mirrored in the struct formats of the Python parser.
+//
+// header (4 bytes):
+//   uint8  version             SENSOR_PACKET_VERSION, never an ASCII digit so legacy text packets stay distinguishable
+//   uint8  sample_count        number of samples that follow, 1..SENSOR_PACKET_MAX_SAMPLES
+//   uint16 sample_interval_ms  average time between two consecutive samples of the packet
+// sample (20 bytes each):
+//   uint32 packet_id
+//   int16  temperature_centi   temperature in 0.01 degC
+//   uint8  humidity            relative humidity in %
+//   uint16 pressure_deci       pressure in 0.1 hPa
+//   uint16 iaq_centi           IAQ index in 0.01
+//   uint32 co2                 CO2 equivalent in ppm
+//   uint32 gas                 gas resistance
+//   uint8  battery             battery level in %
+
+#ifndef SENSOR_PACKET_H
+#define SENSOR_PACKET_H
+
+#include <stdint.h>
+
+#define SENSOR_PACKET_VERSION 1
+#define SENSOR_PACKET_MAX_SAMPLES 6
+
+typedef struct __attribute__((packed)) {
+  uint32_t packet_id;
+  int16_t temperature_centi;
+  uint8_t humidity;
+  uint16_t pressure_deci;
+  uint16_t iaq_centi;
+  uint32_t co2;
+  uint32_t gas;
+  uint8_t battery;
+} sensor_sample_t;
+
+typedef struct __attribute__((packed)) {
+  uint8_t version;
+  uint8_t sample_count;
+  uint16_t sample_interval_ms;
+  sensor_sample_t samples[SENSOR_PACKET_MAX_SAMPLES];
+} sensor_packet_t;
+
+#define SENSOR_PACKET_SIZE(count) (4 + (count) * sizeof(sensor_sample_t))
+
+#endif
@@ -0,0 +1,241 @@
+"""
+Batch writer decoupling the BLE notifications from the InfluxDB writes.
+The notification callback only enqueues the raw packet; a writer task parses the queued packets
+and appends them as line protocol to the durable spool, and a flush task writes the spooled lines
+to InfluxDB in batches, removing them from the spool only after a successful write.
+A batch written late, e.g. replayed after an outage, carries a marker point with the time range of its
+samples, so the backend syncs that range again instead of rescanning behind its watermark periodically.
+"""
+import asyncio
+import time
+
+from influxdb_client.rest import ApiException
+
+import metrics
+from sensor_packet import FIELDS, parse_packet
+
+# Line protocol type of every field; the others are written as floats
+INTEGER_FIELDS = {"packet_id", "humidity", "co2", "gas", "battery"}
+
+
+def escape_tag(value):
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def sample_time_ns(line):
+    # the timestamp closing every line is the time its sample was taken
+    return int(line.rsplit(" ", 1)[1])
+
+
+def is_rejected(error):
+    """
+    Tells whether InfluxDB refused the write for good, e.g. 422 for points beyond the retention of the bucket
+    or 400 for a field type conflict; writing the same lines again would fail the same way. 429 asks to retry.
+    """
+    return isinstance(error, ApiException) and error.status is not None and 400 <= error.status < 500 and error.status != 429
+
+
+def to_lines(measurement, device_id, received_ns, data):
+    """
+    Converts a raw packet into one line protocol line per sample.
+    The last sample was taken when the packet was received, the previous ones one sample interval apart.
+    """
+    samples, interval = parse_packet(data)
+    prefix = f"{measurement},device_id={escape_tag(device_id)} "
+    lines = []
+    for i, sample in enumerate(samples):
+        timestamp = received_ns - int(interval * 1e9) * (len(samples) - 1 - i)
+        fields = ",".join(
+            f"{name}={value}i" if name in INTEGER_FIELDS else f"{name}={float(value)!r}"
+            for name, value in zip(FIELDS, sample)
+        )
+        lines.append(f"{prefix}{fields} {timestamp}")
+    return lines
+
+
+class BatchWriter:
+    """
+    Bounded queue of raw packets drained by a writer task.
+    A batch is written when it holds batch_size packets or flush_interval seconds after its first packet.
+    Overflow policy: when the queue is full the oldest packet is dropped, so a slow spool never blocks
+    the BLE callbacks and the freshest samples are kept.
+    While InfluxDB is unreachable the lines pile up in the spool; once it is back the backlog is replayed
+    oldest first in batches of replay_batch_size lines, at most replay_rate lines per second.
+    A batch whose oldest sample is more than replay_marker_age seconds old is written with a point of
+    replay_measurement holding its first and last sample time; the age must stay below the settle time
+    of the backend sync (SYNC_SETTLE_SECONDS), which reads the samples written in time on its own.
+    """
+
+    def __init__(self, write_api, bucket, org, measurement, spool, max_queue_size=10_000, batch_size=500, flush_interval=1.0,
+                 replay_batch_size=5_000, replay_rate=20_000, retry_min_delay=1.0, retry_max_delay=60.0,
+                 replay_measurement="sensor_replays", replay_marker_age=10.0):
+        self.write_api = write_api
+        self.spool = spool
+        self.bucket = bucket
+        self.org = org
+        self.measurement = measurement
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_batch_size = replay_batch_size
+        self.replay_rate = replay_rate
+        self.retry_min_delay = retry_min_delay
+        self.retry_max_delay = retry_max_delay
+        self.replay_measurement = replay_measurement
+        self.replay_marker_age = replay_marker_age
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.spooled = asyncio.Event()
+
+        # statistics, see report
+        self.enqueued = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.written = 0
+        self.replayed = 0
+        self.write_errors = 0
+        self.rejected = 0
+        self.last_write_latency = 0.0
+        self.max_write_latency = 0.0
+
+    def submit(self, device_id, data):
+        """
+        Enqueues a raw packet without blocking; called from the BLE notification callback.
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            metrics.PACKETS_DROPPED.inc()
+        self.queue.put_nowait((device_id, time.time_ns(), bytes(data)))
+        self.enqueued += 1
+
+    async def next_batch(self):
+        """
+        Waits for the first packet, then collects more until the batch is full or the flush interval elapsed.
+        """
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def encode(self, batch):
+        lines = []
+        for device_id, received_ns, data in batch:
+            try:
+                lines.extend(to_lines(self.measurement, device_id, received_ns, data))
+            except ValueError as e:
+                self.invalid += 1
+                metrics.PARSE_FAILURES.labels(device_id).inc()
+                print(f"[{device_id}] Invalid data received: {e}")
+        return lines
+
+    def with_replay_marker(self, lines, times):
+        """
+        Returns the records to write for the lines: the lines themselves, followed by the replay marker
+        if the batch is late. Both go in the same request, so the marker is only stored with its samples.
+        """
+        written_ns = time.time_ns()
+        if written_ns - min(times) <= self.replay_marker_age * 1e9:
+            return lines
+        return lines + [f"{self.replay_measurement} first={min(times)}i,last={max(times)}i,lines={len(lines)}i {written_ns}"]
+
+    async def write(self, records):
+        """
+        Writes the records in a worker thread, the synchronous client must not block the event loop.
+        """
+        start = time.monotonic()
+        with metrics.WRITE_SECONDS.time():
+            await asyncio.to_thread(self.write_api.write, self.bucket, self.org, records)
+        self.last_write_latency = time.monotonic() - start
+        self.max_write_latency = max(self.max_write_latency, self.last_write_latency)
+
+    def count_written(self, times, replayed):
+        self.written += len(times)
+        metrics.LINES_WRITTEN.inc(len(times))
+        if replayed:
+            self.replayed += len(times)
+            metrics.LINES_REPLAYED.inc(len(times))
+
+        # the samples were stamped with the time their packet was received
+        written_ns = time.time_ns()
+        for sample_ns in times:
+            metrics.NOTIFY_TO_WRITE_SECONDS.observe((written_ns - sample_ns) / 1e9)
+
+    async def run(self):
+        """
+        Moves the queued packets to the spool.
+        """
+        while True:
+            lines = self.encode(await self.next_batch())
+            if lines:
+                await asyncio.to_thread(self.spool.append, lines)
+                self.spooled.set()
+
+    async def flush(self):
+        """
+        Writes the spooled lines to InfluxDB and acknowledges them, retrying with a growing delay on failure.
+        A batch InfluxDB rejects for good (see is_rejected) is moved to the dead letter table of the spool
+        instead, so it does not block the lines behind it. Returns once the spool is empty.
+        """
+        delay = self.retry_min_delay
+        while True:
+            last_id, lines = await asyncio.to_thread(self.spool.peek, self.replay_batch_size)
+            if not lines:
+                return
+            times = [sample_time_ns(line) for line in lines]
+            records = self.with_replay_marker(lines, times)
+            start = time.monotonic()
+            try:
+                await self.write(records)
+            except Exception as e:
+                self.write_errors += 1
+                metrics.WRITE_ERRORS.inc()
+                if is_rejected(e):
+                    print(f"InfluxDB rejected {len(lines)} samples, moving them to the dead letter table: {e}")
+                    await asyncio.to_thread(self.spool.reject, last_id, str(e).strip())
+                    self.rejected += len(lines)
+                    metrics.LINES_REJECTED.inc(len(lines))
+                    continue
+                print(f"Error while writing {len(lines)} samples to InfluxDB, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+                continue
+            await asyncio.to_thread(self.spool.ack, last_id)
+            delay = self.retry_min_delay
+            self.count_written(times, records is not lines)
+            # rate limit the replay of a backlog, so catching up does not flood InfluxDB
+            await asyncio.sleep(max(0.0, len(lines) / self.replay_rate - (time.monotonic() - start)))
+
+    async def flush_loop(self):
+        while True:
+            await self.spooled.wait()
+            self.spooled.clear()
+            await self.flush()
+
+    async def close(self):
+        """
+        Spools what is still queued and tries a last flush; whatever is not written is replayed on the next start.
+        """
+        lines = self.encode([self.queue.get_nowait() for _ in range(self.queue.qsize())])
+        if lines:
+            await asyncio.to_thread(self.spool.append, lines)
+        try:
+            await asyncio.wait_for(self.flush(), timeout=10)
+        except asyncio.TimeoutError:
+            print(f"{self.spool.size()} samples left in the spool")
+
+    def report(self):
+        return (f"queue depth: {self.queue.qsize()}, enqueued: {self.enqueued}, dropped: {self.dropped}, "
+                f"invalid: {self.invalid}, spooled: {self.spool.size()}, spool dropped: {self.spool.dropped}, "
+                f"written: {self.written}, replayed: {self.replayed}, write errors: {self.write_errors}, rejected: {self.rejected}, "
+                f"write latency: {self.last_write_latency * 1000:.1f} ms (max {self.max_write_latency * 1000:.1f} ms)")
@@ -1,130 +1,191 @@
 import asyncio
 from bleak import BleakClient, BleakScanner, BleakError
-from decouple import config
-from influxdb_client import InfluxDBClient, Point, WriteOptions
-from datetime import datetime
-import re
+from decouple import config, Csv
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+from prometheus_client import start_http_server
 
-# Precompiled regular expression pattern
-pattern = re.compile(r'(\d+),T:([\d.-]+),H:(\d+),P:([\d.-]+),IAQ:([\d.-]+),CO2:(\d+),Gas:(\d+),Batt:(\d+)')
+import metrics
+from batch_writer import BatchWriter
+from spool import Spool
 
 # 0 means stop notification, 1 means start notification
 PROGRAM_COMMAND_UUID = "19b10000-8002-537e-4f6c-d104768a1214" 
 SENSORS_UUID = "19b10000-A001-537e-4f6c-d104768a1214" # UUID to read from
+SERVICE_UUID = "19b10000-0000-537e-4f6c-d104768a1214" # Service advertised by the squareAI devices, discovery filters on it
 
-nicla_address = "EE:DF:46:E7:08:80" # Nicla Sense Me device address
-device_name = None
-client = None
-isStarted = False
 push2influxdb = True
 
+# Devices to connect to; if empty, the devices are discovered by scanning
+NICLA_ADDRESSES = config('NICLA_ADDRESSES', default='', cast=Csv())
+SCAN_INTERVAL = config('SCAN_INTERVAL', default=30, cast=float) # seconds between two discoveries
+RECONNECT_MIN_DELAY = config('RECONNECT_MIN_DELAY', default=2, cast=float)
+RECONNECT_MAX_DELAY = config('RECONNECT_MAX_DELAY', default=60, cast=float)
+
+# Batch writer settings, see BatchWriter
+WRITE_QUEUE_SIZE = config('WRITE_QUEUE_SIZE', default=10_000, cast=int)
+WRITE_BATCH_SIZE = config('WRITE_BATCH_SIZE', default=500, cast=int)
+WRITE_FLUSH_INTERVAL = config('WRITE_FLUSH_INTERVAL', default=1.0, cast=float) # seconds
+STATS_INTERVAL = config('STATS_INTERVAL', default=60, cast=float) # seconds between two statistics reports
+METRICS_PORT = config('METRICS_PORT', default=8001, cast=int) # Prometheus exporter, 0 disables it
+
+# Durable spool settings, see Spool
+SPOOL_PATH = config('SPOOL_PATH', default='spool.sqlite3')
+SPOOL_MAX_LINES = config('SPOOL_MAX_LINES', default=2_000_000, cast=int)
+REPLAY_BATCH_SIZE = config('REPLAY_BATCH_SIZE', default=5_000, cast=int)
+REPLAY_RATE = config('REPLAY_RATE', default=20_000, cast=float) # lines per second while catching up
+# batches with samples older than this are marked for the backend, keep it below its SYNC_SETTLE_SECONDS
+REPLAY_MARKER_AGE = config('REPLAY_MARKER_AGE', default=10, cast=float) # seconds
+
 # InfluxDB Settings
 INFLUXDB_URL = config('INFLUXDB_URL', cast=str)
 INFLUXDB_TOKEN = config('INFLUXDB_TOKEN', cast=str)
 INFLUXDB_ORG = config('INFLUXDB_ORG', cast=str)
 INFLUXDB_BUCKET = config('INFLUXDB_BUCKET', cast=str)
 
-# Setup InfluxDB client
-influxclient = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, debug=True, org=INFLUXDB_ORG)
-
-# Configure batch write client
-write_api = influxclient.write_api(write_options=WriteOptions(
-        batch_size=10,
-        flush_interval=10_000,
-        jitter_interval=2_000,
-        retry_interval=5_000,
-        max_retries=5,
-        max_retry_delay=30_000,
-        max_close_wait=300_000,
-        exponential_base=2
-    ))
-
-# Helper function to write to InfluxDB directly without appending
-def write_to_influxdb(measurement, data, timestamp):
-    point = Point(measurement).time(timestamp)
-    for key, value in data.items():
-        point = point.field(key, value)
-    write_api.write(INFLUXDB_BUCKET, INFLUXDB_ORG, point)
-
-def notification_handler(sender: int, data: bytearray):
-    global pattern
-
-    raw_data = data.decode('utf-8')
-    match = pattern.match(raw_data)
-    if match:
-        packet_id, t, h, p, iaq, co2, gas, batt = match.groups()
-        timestamp = datetime.utcnow()
-        if push2influxdb:
-            write_to_influxdb("movement_sensor_data", {
-                "packet_id": int(packet_id),
-                "temperature": float(t),
-                "humidity": int(h),
-                "pressure": float(p),
-                "iaq": float(iaq),
-                "co2": int(co2),
-                "gas": int(gas),
-                "battery": int(batt)
-            }, timestamp)
-        
-        print(f"Packet ID: {packet_id}, Temperature: {t}, Humidity: {h}, Pressure: {p}, IAQ: {iaq}, CO2: {co2}, Gas: {gas}, Battery: {batt}")
-    else:
-        print("Invalid data received:", raw_data)
-
-async def main_loop(address):
-    global isStarted, client
-    while True:
-        try:
-            async with BleakClient(address) as client:
-                if client.is_connected:
-                    print("Connected successfully!")
-                    if not isStarted:
+
+class DeviceState:
+    """Connection state of a single device, owned by its own task."""
+
+    def __init__(self, address, name=None):
+        self.address = address
+        self.name = name or address
+        self.client = None
+        self.is_started = False
+        self.reconnect_delay = RECONNECT_MIN_DELAY
+        self.packets = 0
+
+
+def notification_handler(writer, device, sender: int, data: bytearray):
+    # keep the callback minimal, the packet is parsed and written by the writer task
+    device.packets += 1
+    metrics.PACKETS_RECEIVED.labels(device.address).inc()
+    if push2influxdb:
+        writer.submit(device.address, data)
+
+
+class DeviceManager:
+    """Discovers the squareAI devices and keeps one reconnecting task per device."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.devices = {}
+        self.tasks = {}
+        # BlueZ does not connect reliably while a scan is running, so scans and connects take turns
+        self.radio_lock = asyncio.Lock()
+
+    def add_device(self, address, name=None):
+        if address in self.devices:
+            return
+        print(f"Adding device {name or address} ({address})")
+        device = DeviceState(address, name)
+        self.devices[address] = device
+        self.tasks[address] = asyncio.create_task(self.device_loop(device))
+
+    async def discover(self):
+        async with self.radio_lock:
+            # the local name may only come with the scan response, the advertised service is always there
+            found = await BleakScanner.discover(timeout=5.0, service_uuids=[SERVICE_UUID])
+        for ble_device in found:
+            self.add_device(ble_device.address, ble_device.name)
+
+    async def device_loop(self, device):
+        while True:
+            try:
+                async with self.radio_lock:
+                    client = device.client = BleakClient(device.address)
+                    await client.connect()
+                try:
+                    print(f"[{device.name}] Connected successfully!")
+                    if not device.is_started:
                         # send a byte 1 to start the program to the command characteristic
                         await client.write_gatt_char(PROGRAM_COMMAND_UUID, bytearray([1]))
-                        isStarted = True
-            
+                        device.is_started = True
+
                     # start the sensors notification
-                    await client.start_notify(SENSORS_UUID, notification_handler)
+                    await client.start_notify(SENSORS_UUID, lambda sender, data: notification_handler(self.writer, device, sender, data))
+                    device.reconnect_delay = RECONNECT_MIN_DELAY
                     while client.is_connected:
                         await asyncio.sleep(1)
-                else:
-                    print("Failed to connect, retrying...")
-                    await asyncio.sleep(2)
-                    if isStarted:
-                        isStarted = False
-        except BleakError as e:
-            print(f"BleakError while connecting: {e}")
-        except Exception as e:
-            print(f"Unexpected error while connecting: {e}")
-        finally:
-            print("Disconnected. Trying to reconnect...")
-            await asyncio.sleep(2)
-            if client:
-                await client.stop_notify(SENSORS_UUID)
+                finally:
+                    if client.is_connected:
+                        await client.disconnect()
+            except BleakError as e:
+                print(f"[{device.name}] BleakError while connecting: {e}")
+                device.is_started = False
+            except Exception as e:
+                print(f"[{device.name}] Unexpected error while connecting: {e}")
+                device.is_started = False
+            # back off exponentially while the device stays unreachable, without blocking the other devices
+            print(f"[{device.name}] Disconnected. Trying to reconnect in {device.reconnect_delay:.0f}s...")
+            await asyncio.sleep(device.reconnect_delay)
+            device.reconnect_delay = min(device.reconnect_delay * 2, RECONNECT_MAX_DELAY)
+
+    async def run(self):
+        for address in NICLA_ADDRESSES:
+            self.add_device(address)
+        while True:
+            if not NICLA_ADDRESSES:
+                try:
+                    await self.discover()
+                except BleakError as e:
+                    print(f"BleakError while scanning: {e}")
+            await asyncio.sleep(SCAN_INTERVAL)
+
+    async def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        for device in self.devices.values():
+            try:
+                if device.client and device.client.is_connected:
+                    await device.client.stop_notify(SENSORS_UUID)
+                    await device.client.disconnect()
+            except Exception as e:
+                print(f"[{device.name}] Error during cleanup: {e}")
+
+
+async def report_stats(writer):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        print(writer.report())
+
        
 async def main():
-    global nicla_address, client
-    try:
-        await main_loop(nicla_address)
+    # Setup InfluxDB client
+    influxclient = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, debug=True, org=INFLUXDB_ORG)
+
+    # The batches are built by the BatchWriter, so the write client writes synchronously
+    write_api = influxclient.write_api(write_options=SYNCHRONOUS)
 
+    spool = Spool(SPOOL_PATH, SPOOL_MAX_LINES)
+    writer = BatchWriter(write_api, INFLUXDB_BUCKET, INFLUXDB_ORG, "movement_sensor_data", spool,
+                         max_queue_size=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+                         replay_batch_size=REPLAY_BATCH_SIZE, replay_rate=REPLAY_RATE, replay_marker_age=REPLAY_MARKER_AGE)
+    # replay what a previous run left in the spool
+    writer.spooled.set()
+    if METRICS_PORT:
+        metrics.QUEUE_DEPTH.set_function(writer.queue.qsize)
+        metrics.SPOOL_DEPTH.set_function(spool.size)
+        start_http_server(METRICS_PORT)
+    manager = DeviceManager(writer)
+    tasks = [asyncio.create_task(writer.run()), asyncio.create_task(writer.flush_loop()), asyncio.create_task(report_stats(writer))]
+    try:
+        await manager.run()
     except Exception as e:
         print(f"Unexpected error: {e}")
-    except KeyboardInterrupt:
-        print("Interrupted by user.")
     finally:
         print("Cleaning up...")
-        if client:
-            try:
-                if client.is_connected:
-                    await client.stop_notify(SENSORS_UUID)
-                    await client.disconnect()
-                else:
-                    print("Client is not connected.")
-            except Exception as e:
-                print(f"Error during cleanup: {e}")
+        await manager.close()
+        for task in tasks:
+            task.cancel()
+        await writer.close()
+        spool.close()
+        write_api.close()
+        influxclient.close()
 
-loop = asyncio.get_event_loop()
-
-try:
-    loop.run_until_complete(main())
-finally:
-    loop.close()
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Interrupted by user.")
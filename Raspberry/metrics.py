@@ -0,0 +1,18 @@
+"""
+Prometheus metrics of the hub, served by the exporter started in main.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+PACKETS_RECEIVED = Counter("hub_ble_packets_total", "BLE notifications received", ["device"])
+PACKETS_DROPPED = Counter("hub_packets_dropped_total", "Packets dropped because the write queue was full")
+PARSE_FAILURES = Counter("hub_parse_failures_total", "Packets that could not be parsed", ["device"])
+QUEUE_DEPTH = Gauge("hub_queue_depth", "Packets waiting in the write queue")
+SPOOL_DEPTH = Gauge("hub_spool_depth", "Lines waiting in the spool")
+WRITE_SECONDS = Histogram("hub_influx_write_seconds", "Duration of the InfluxDB writes")
+LINES_WRITTEN = Counter("hub_lines_written_total", "Lines written to InfluxDB")
+LINES_REPLAYED = Counter("hub_lines_replayed_total", "Lines written late, with a replay marker for the backend")
+WRITE_ERRORS = Counter("hub_write_errors_total", "Failed InfluxDB writes")
+LINES_REJECTED = Counter("hub_lines_rejected_total", "Lines InfluxDB refused for good, moved to the dead letter table of the spool")
+# the samples are stamped with the notification time, earlier samples of a multi-sample packet are backdated by their interval
+NOTIFY_TO_WRITE_SECONDS = Histogram("hub_notify_to_write_seconds", "Time from the BLE notification to the InfluxDB write of its samples",
+                                    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 3600))
@@ -0,0 +1,42 @@
+"""
+Parser of the sensor data notifications sent by the squareAI devices.
+The binary layout is defined in Arduino/Nicla_BLE_Advertising/sensor_packet.h, the struct formats below mirror it.
+The legacy text packets of the older firmware are still accepted.
+"""
+import re
+import struct
+
+PACKET_VERSION = 1
+
+HEADER = struct.Struct("<BBH")  # version, sample_count, sample_interval_ms
+SAMPLE = struct.Struct("<IhBHHIIB")  # packet_id, temperature, humidity, pressure, iaq, co2, gas, battery
+
+FIELDS = ("packet_id", "temperature", "humidity", "pressure", "iaq", "co2", "gas", "battery")
+
+# Legacy text packets, e.g. "12,T:21.50,H:40,P:1013.25,IAQ:25.00,CO2:500,Gas:12000,Batt:80"
+legacy_pattern = re.compile(r'(\d+),T:([\d.-]+),H:(\d+),P:([\d.-]+),IAQ:([\d.-]+),CO2:(\d+),Gas:(\d+),Batt:(\d+)')
+
+
+def parse_packet(data):
+    """
+    Parses a notification into a list of samples and the interval between them in seconds.
+    Every sample is a tuple in the order of FIELDS. Raises ValueError if the packet is invalid.
+    """
+    if data and data[0] == PACKET_VERSION:
+        if len(data) < HEADER.size:
+            raise ValueError("truncated header")
+        _, count, interval_ms = HEADER.unpack_from(data)
+        if len(data) < HEADER.size + count * SAMPLE.size:
+            raise ValueError(f"truncated packet with {count} samples")
+
+        samples = []
+        for offset in range(HEADER.size, HEADER.size + count * SAMPLE.size, SAMPLE.size):
+            packet_id, temperature, humidity, pressure, iaq, co2, gas, battery = SAMPLE.unpack_from(data, offset)
+            samples.append((packet_id, temperature / 100, humidity, pressure / 10, iaq / 100, co2, gas, battery))
+        return samples, interval_ms / 1000
+
+    match = legacy_pattern.match(data.decode('utf-8', errors='replace'))
+    if not match:
+        raise ValueError(f"unknown packet {bytes(data)!r}")
+    packet_id, t, h, p, iaq, co2, gas, batt = match.groups()
+    return [(int(packet_id), float(t), int(h), float(p), float(iaq), int(co2), int(gas), int(batt))], 0.0
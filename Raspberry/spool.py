@@ -0,0 +1,78 @@
+"""
+Durable on-disk spool of line protocol lines waiting to be written to InfluxDB.
+The lines are kept in an append-only SQLite table in WAL mode and deleted only once InfluxDB acknowledged them.
+A line written again after a crash between write and acknowledgement is harmless, InfluxDB overwrites
+a point with the same series and timestamp.
+"""
+import sqlite3
+import threading
+
+
+class Spool:
+    """
+    Append-only SQLite spool with a size cap.
+    When the cap is exceeded the oldest lines are discarded, so disk use stays bounded during long outages.
+    The methods are blocking and thread safe, call them from a worker thread.
+    """
+
+    def __init__(self, path, max_lines):
+        self.max_lines = max_lines
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, line TEXT NOT NULL)")
+        # lines InfluxDB refused for good, kept for inspection, see reject
+        self.conn.execute("CREATE TABLE IF NOT EXISTS dead_letter (id INTEGER PRIMARY KEY, line TEXT NOT NULL, error TEXT NOT NULL)")
+
+    def append(self, lines):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT INTO spool (line) VALUES (?)", ((line,) for line in lines))
+                # ids are consecutive and lines are only removed from the front, so the id range is the size
+                first, last = self.conn.execute("SELECT min(id), max(id) FROM spool").fetchone()
+                if last - first + 1 > self.max_lines:
+                    cursor = self.conn.execute("DELETE FROM spool WHERE id <= ?", (last - self.max_lines,))
+                    self.dropped += cursor.rowcount
+
+    def peek(self, limit):
+        """
+        Returns the id of the last of the oldest limit lines and the lines, or (None, []) if the spool is empty.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT id, line FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [line for _, line in rows]
+
+    def ack(self, last_id):
+        """
+        Removes the lines up to last_id once they are written.
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+
+    def reject(self, last_id, error):
+        """
+        Moves the lines up to last_id to the dead letter table, when InfluxDB refused them and would refuse them again.
+        The dead letter table keeps the last max_lines lines.
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("INSERT INTO dead_letter (id, line, error) SELECT id, line, ? FROM spool WHERE id <= ?", (error, last_id))
+                self.conn.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+                self.conn.execute("DELETE FROM dead_letter WHERE id <= ?", (last_id - self.max_lines,))
+
+    def size(self):
+        with self.lock:
+            first, last = self.conn.execute("SELECT min(id), max(id) FROM spool").fetchone()
+        return 0 if first is None else last - first + 1
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,214 @@
+"""
+Trains the power consumption model served by the backend, without a notebook.
+
+    python ai/train.py                                    # from ai/bolzanosynthetic.csv
+    python ai/train.py --csv history.csv --install        # and replace the served model
+    python ai/train.py --query "SELECT temp, humidity, windspeed, winddir, cloudcover, uvindex, encons FROM ..."
+
+The features are the weather columns the backend predicts from (WEATHER_FEATURES) and the target is
+the daily consumption (--target). A CSV may be comma or semicolon separated; --query reads the rows
+from the PostgreSQL database configured in backend/.env, or from --dsn.
+
+A grid search over the decision tree parameters is cross-validated with shuffled K folds; the folds
+of all the candidates run in parallel on --jobs cores and every split and tree uses --seed, so the
+same data always gives the same model. The best candidate is refitted on all the rows.
+
+Every run writes a versioned artifact to --output-dir: model-<version>.sav and model-<version>.json,
+where the version is the hash of the model file, the same the backend reports. The JSON holds the
+feature schema, the cross-validated metrics, the fit and predict timings and the library versions.
+--install also copies both to the served model path, MODEL_PATH of the backend settings (ai/model.sav
+by default); the backend picks the new model up on its next prediction run.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from prediction import WEATHER_FEATURES  # noqa: E402
+
+DEFAULT_CSV = os.path.join(ROOT, "ai", "bolzanosynthetic.csv")
+
+# Candidates of the grid search; None lets the tree grow fully, like the model of the notebook
+PARAM_GRID = {
+    "max_depth": [None, 2, 3, 4, 6, 8],
+    "min_samples_leaf": [1, 2, 4],
+}
+
+SCORING = {"mse": "neg_mean_squared_error", "mae": "neg_mean_absolute_error", "r2": "r2"}
+
+
+def read_csv(path):
+    """
+    Reads a comma or semicolon separated CSV file.
+    """
+    with open(path, newline="") as f:
+        header = f.readline()
+    return pd.read_csv(path, sep=";" if header.count(";") > header.count(",") else ",")
+
+
+def read_postgres(query, dsn=None):
+    """
+    Runs the query on the backend database, or the one of the given DSN, and returns its rows.
+    """
+    import asyncpg
+
+    if dsn is None:
+        from settings import get_settings
+        dsn = get_settings().postgres_connection_string
+
+    async def fetch():
+        conn = await asyncpg.connect(dsn)
+        try:
+            return await conn.fetch(query)
+        finally:
+            await conn.close()
+
+    rows = asyncio.run(fetch())
+    return pd.DataFrame([dict(row) for row in rows])
+
+
+def training_set(df, target):
+    """
+    Returns the feature matrix in WEATHER_FEATURES order and the target vector, without incomplete rows.
+    """
+    missing = [name for name in WEATHER_FEATURES + [target] if name not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}.")
+    df = df[WEATHER_FEATURES + [target]].astype(float).dropna()
+    return df[WEATHER_FEATURES].to_numpy(), df[target].to_numpy()
+
+
+def train(X, y, folds, jobs, seed):
+    """
+    Cross-validates every candidate of PARAM_GRID and refits the best one on all the rows.
+    Returns the fitted search.
+    """
+    search = GridSearchCV(
+        DecisionTreeRegressor(random_state=seed),
+        PARAM_GRID,
+        scoring=SCORING,
+        refit="mse",
+        cv=KFold(n_splits=min(folds, len(y)), shuffle=True, random_state=seed),
+        n_jobs=jobs,
+    )
+    search.fit(X, y)
+    return search
+
+
+def predict_seconds_per_row(model, X, repeats=100):
+    """
+    Times a batched predict over the training rows, as the backend scores a whole forecast at once.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict(X)
+    return (time.perf_counter() - start) / (repeats * len(X))
+
+
+def metadata(search, X, y, source, args, timings):
+    best = search.best_index_
+    results = search.cv_results_
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "model": type(search.best_estimator_).__name__,
+        "params": search.best_params_,
+        "features": WEATHER_FEATURES,
+        "target": args.target,
+        "source": dict(source, rows=len(y), sha256=hashlib.sha256(np.ascontiguousarray(np.column_stack([X, y])).tobytes()).hexdigest()),
+        "seed": args.seed,
+        "cv": {
+            "folds": search.n_splits_,
+            "jobs": args.jobs,
+            "candidates": len(results["params"]),
+            # the scorers are negated errors, so that greater is better
+            "mse": -results["mean_test_mse"][best],
+            "mse_std": results["std_test_mse"][best],
+            "mae": -results["mean_test_mae"][best],
+            "r2": results["mean_test_r2"][best],
+        },
+        "timings": dict(timings, **{
+            "mean_fit_s": results["mean_fit_time"][best],
+            "mean_score_s": results["mean_score_time"][best],
+            "refit_s": search.refit_time_,
+            "predict_us_per_row": predict_seconds_per_row(search.best_estimator_, X) * 1e6,
+        }),
+        "versions": {"python": platform.python_version(), "scikit-learn": sklearn.__version__, "numpy": np.__version__},
+    }
+
+
+def write_atomic(path, content):
+    """
+    Writes the file next to its destination and renames it, so a reader never sees it half written.
+    """
+    partial_path = path + ".partial"
+    with open(partial_path, "wb") as f:
+        f.write(content)
+    os.replace(partial_path, path)
+
+
+def main(args):
+    started = time.perf_counter()
+    if args.query:
+        df, source = read_postgres(args.query, args.dsn), {"query": args.query}
+    else:
+        df, source = read_csv(args.csv), {"csv": os.path.relpath(os.path.abspath(args.csv), ROOT)}
+    X, y = training_set(df, args.target)
+    if len(y) < 2:
+        raise ValueError(f"At least 2 complete rows are needed to train, got {len(y)}.")
+    timings = {"load_s": time.perf_counter() - started}
+
+    started = time.perf_counter()
+    search = train(X, y, args.folds, args.jobs, args.seed)
+    timings["search_s"] = time.perf_counter() - started
+
+    content = pickle.dumps(search.best_estimator_)
+    # the backend versions a model by the hash of its file, see PredictionService
+    version = hashlib.sha256(content).hexdigest()[:12]
+    info = dict({"version": version}, **metadata(search, X, y, source, args, timings))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    model_path = os.path.join(args.output_dir, f"model-{version}.sav")
+    description = json.dumps(info, indent=2, default=float).encode()
+    write_atomic(model_path, content)
+    write_atomic(os.path.splitext(model_path)[0] + ".json", description)
+    installed = None
+    if args.install is not None:
+        from settings import get_settings
+
+        # the metadata first: the backend reloads when the model file changes
+        installed = os.path.abspath(args.install or get_settings().MODEL_PATH)
+        write_atomic(os.path.splitext(installed)[0] + ".json", description)
+        write_atomic(installed, content)
+
+    print(json.dumps(dict(info, path=model_path, installed=installed), indent=2, default=float))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="training data file")
+    parser.add_argument("--query", help="read the training data from PostgreSQL with this SELECT instead")
+    parser.add_argument("--dsn", help="PostgreSQL connection string, by default the one of the backend")
+    parser.add_argument("--target", default="encons", help="column of the daily consumption")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel fits, -1 for all cores")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "ai", "models"))
+    parser.add_argument("--install", nargs="?", const="",
+                        help="also replace the served model, the MODEL_PATH of the backend unless a path is given")
+    main(parser.parse_args())
@@ -0,0 +1,41 @@
+"""
+This module contains the downsampling used to cap the number of points sent to the charts.
+"""
+
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Returns the indices of the points kept by the Largest-Triangle-Three-Buckets algorithm.
+    The first and the last point are always kept; the points in between are split into threshold - 2
+    buckets and from each bucket the point forming the largest triangle with the previously kept point
+    and the average of the next bucket is kept. x must be sorted ascending.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the inner points, each at least one point wide
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+            avg_x = x[next_start:next_stop].mean()
+            avg_y = y[next_start:next_stop].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+
+        bucket_x = x[start:stop]
+        bucket_y = y[start:stop]
+        area = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+
+    return indices
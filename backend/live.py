@@ -0,0 +1,39 @@
+"""
+This module contains the broadcaster that pushes newly synced sensor data to the live subscribers.
+"""
+
+import asyncio
+
+
+class Broadcaster:
+    """
+    Fans out messages to any number of subscribers, each with its own bounded queue.
+    A subscriber that does not keep up loses its oldest messages instead of slowing down the others.
+    """
+
+    def __init__(self, max_queued_messages=100):
+        self.max_queued_messages = max_queued_messages
+        self.subscribers = set()
+
+    def subscribe(self):
+        """
+        Registers a new subscriber and returns the queue its messages are delivered to.
+        """
+        queue = asyncio.Queue(maxsize=self.max_queued_messages)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """
+        Removes the subscriber owning the queue.
+        """
+        self.subscribers.discard(queue)
+
+    def publish(self, message):
+        """
+        Delivers the message to every subscriber without waiting.
+        """
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
@@ -0,0 +1,92 @@
+"""
+This module contains the Prometheus metrics of the backend, exposed by the /metrics endpoint.
+With several uvicorn workers, PROMETHEUS_MULTIPROC_DIR must point to an empty folder before the
+workers start: every worker then writes its metrics there and a scrape aggregates all of them.
+"""
+
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# ETL stages, see sync_sensor_data
+INFLUX_QUERY_SECONDS = Histogram("etl_influx_query_seconds", "Time spent querying a chunk from InfluxDB, including the CSV parsing")
+PIVOT_SECONDS = Histogram("etl_pivot_seconds", "Time spent shaping a queried chunk into sensor_data rows")
+DB_WRITE_SECONDS = Histogram("etl_db_write_seconds", "Time spent inserting a chunk into PostgreSQL, rollups included")
+ROWS_PIVOTED = Counter("etl_rows_pivoted_total", "Rows read from InfluxDB")
+ROWS_STORED = Counter("etl_rows_total", "Rows stored in PostgreSQL, by result", ["result"])
+# only the worker holding the sync lock sets it, so the most recent value of a live worker is the current one
+ETL_LAG = Gauge("etl_lag_seconds", "Age of the sync watermark after the last sync", multiprocess_mode="livemostrecent")
+
+# Scheduled jobs, see Scheduler
+JOB_SECONDS = Histogram("scheduler_job_seconds", "Duration of the scheduled job runs", ["job", "outcome"])
+
+# Sensor data API, see query_sensor_data_postgres
+SERIALIZATION_SECONDS = Histogram("api_serialization_seconds", "Time spent encoding a /get_sensor_data response, database reads excluded", ["format"])
+ROWS_SERVED = Counter("api_rows_served_total", "Rows sent by /get_sensor_data", ["format"])
+
+# CSV uploads, see upload_csv
+UPLOAD_ROWS = Counter("upload_rows_total", "Rows of the files uploaded to /upload, by table and result", ["table", "result"])
+
+
+def multiprocess_enabled():
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def latest():
+    """
+    Returns the metrics in the Prometheus text format and its content type. In multiprocess mode
+    they are read from the files of all the workers, otherwise from the registry of this process.
+    """
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """
+    Drops the live gauges of this worker on shutdown, so a stopped worker no longer reports them.
+    """
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def observe_serialization(output, encode, batches):
+    """
+    Passes the encoded chunks through while timing the encoder. The time spent waiting for the
+    row batches is subtracted, so a response observes the serialization time only.
+    encode is called with the row batches and returns the generator of encoded chunks.
+    """
+    fetching = 0.0
+
+    async def timed_batches():
+        nonlocal fetching
+        iterator = batches.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                rows = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                fetching += time.perf_counter() - start
+            ROWS_SERVED.labels(output).inc(len(rows))
+            yield rows
+
+    iterator = encode(timed_batches()).__aiter__()
+    encoding = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            fetched = fetching
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                encoding += time.perf_counter() - start - (fetching - fetched)
+            yield chunk
+    finally:
+        SERIALIZATION_SECONDS.labels(output).observe(encoding)
@@ -1,9 +1,121 @@
+-- Raw samples, one row per device and sample time, range-partitioned by month.
+-- Partitions are created on demand by sensor_data_ensure_partitions, which the ETL calls before inserting.
 CREATE TABLE sensor_data (
-  timestamp INT PRIMARY KEY NOT NULL,
+  device_id TEXT NOT NULL,
+  ts TIMESTAMPTZ NOT NULL,
   temperature DECIMAL(5,2) NOT NULL,
   humidity INT NOT NULL,
   iaq DECIMAL(5,2) NOT NULL,
   co2 INT NOT NULL,
   gas INT NOT NULL,
-  battery INT NOT NULL
+  battery INT NOT NULL,
+  PRIMARY KEY (device_id, ts)
+) PARTITION BY RANGE (ts);
+
+-- The API reads and pages the rows in (ts, device_id) order, see get_sensor_data: with this index a page
+-- is an index range scan from the cursor instead of a sort of every row up to the end of the range
+CREATE INDEX sensor_data_ts_device_idx ON sensor_data (ts, device_id);
+
+-- Per minute and per hour rollups, kept after the raw partitions are dropped
+CREATE TABLE sensor_data_1m (
+  device_id TEXT NOT NULL,
+  bucket TIMESTAMPTZ NOT NULL,
+  samples INT NOT NULL,
+  temperature_min DECIMAL(5,2), temperature_avg DOUBLE PRECISION, temperature_max DECIMAL(5,2),
+  humidity_min INT, humidity_avg DOUBLE PRECISION, humidity_max INT,
+  iaq_min DECIMAL(5,2), iaq_avg DOUBLE PRECISION, iaq_max DECIMAL(5,2),
+  co2_min INT, co2_avg DOUBLE PRECISION, co2_max INT,
+  gas_min INT, gas_avg DOUBLE PRECISION, gas_max INT,
+  battery_min INT, battery_avg DOUBLE PRECISION, battery_max INT,
+  PRIMARY KEY (device_id, bucket)
 );
+CREATE INDEX sensor_data_1m_bucket_brin ON sensor_data_1m USING BRIN (bucket);
+
+CREATE TABLE sensor_data_1h (LIKE sensor_data_1m INCLUDING ALL);
+
+-- Creates the monthly partitions covering [from_ts, to_ts]
+CREATE OR REPLACE FUNCTION sensor_data_ensure_partitions(from_ts TIMESTAMPTZ, to_ts TIMESTAMPTZ) RETURNS void AS $$
+DECLARE
+  month_start TIMESTAMPTZ := date_trunc('month', from_ts, 'UTC');
+  partition_name TEXT;
+BEGIN
+  WHILE month_start <= to_ts LOOP
+    partition_name := 'sensor_data_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+    IF to_regclass(partition_name) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF sensor_data FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_start + interval '1 month'
+      );
+    END IF;
+    month_start := month_start + interval '1 month';
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes the rollups of the buckets touched by the raw rows in [from_ts, to_ts].
+-- The minute buckets are rebuilt from the raw rows and the hour buckets from the minute buckets,
+-- so running it again over the same range is harmless.
+CREATE OR REPLACE FUNCTION sensor_data_refresh_rollups(from_ts TIMESTAMPTZ, to_ts TIMESTAMPTZ) RETURNS void AS $$
+BEGIN
+  INSERT INTO sensor_data_1m
+  SELECT device_id, date_trunc('minute', ts), count(*),
+    min(temperature), avg(temperature), max(temperature),
+    min(humidity), avg(humidity), max(humidity),
+    min(iaq), avg(iaq), max(iaq),
+    min(co2), avg(co2), max(co2),
+    min(gas), avg(gas), max(gas),
+    min(battery), avg(battery), max(battery)
+  FROM sensor_data
+  WHERE ts >= date_trunc('minute', from_ts) AND ts < date_trunc('minute', to_ts) + interval '1 minute'
+  GROUP BY 1, 2
+  ON CONFLICT (device_id, bucket) DO UPDATE SET
+    samples = EXCLUDED.samples,
+    temperature_min = EXCLUDED.temperature_min, temperature_avg = EXCLUDED.temperature_avg, temperature_max = EXCLUDED.temperature_max,
+    humidity_min = EXCLUDED.humidity_min, humidity_avg = EXCLUDED.humidity_avg, humidity_max = EXCLUDED.humidity_max,
+    iaq_min = EXCLUDED.iaq_min, iaq_avg = EXCLUDED.iaq_avg, iaq_max = EXCLUDED.iaq_max,
+    co2_min = EXCLUDED.co2_min, co2_avg = EXCLUDED.co2_avg, co2_max = EXCLUDED.co2_max,
+    gas_min = EXCLUDED.gas_min, gas_avg = EXCLUDED.gas_avg, gas_max = EXCLUDED.gas_max,
+    battery_min = EXCLUDED.battery_min, battery_avg = EXCLUDED.battery_avg, battery_max = EXCLUDED.battery_max;
+
+  INSERT INTO sensor_data_1h
+  SELECT device_id, date_trunc('hour', bucket), sum(samples),
+    min(temperature_min), sum(temperature_avg * samples) / sum(samples), max(temperature_max),
+    min(humidity_min), sum(humidity_avg * samples) / sum(samples), max(humidity_max),
+    min(iaq_min), sum(iaq_avg * samples) / sum(samples), max(iaq_max),
+    min(co2_min), sum(co2_avg * samples) / sum(samples), max(co2_max),
+    min(gas_min), sum(gas_avg * samples) / sum(samples), max(gas_max),
+    min(battery_min), sum(battery_avg * samples) / sum(samples), max(battery_max)
+  FROM sensor_data_1m
+  WHERE bucket >= date_trunc('hour', from_ts) AND bucket < date_trunc('hour', to_ts) + interval '1 hour'
+  GROUP BY 1, 2
+  ON CONFLICT (device_id, bucket) DO UPDATE SET
+    samples = EXCLUDED.samples,
+    temperature_min = EXCLUDED.temperature_min, temperature_avg = EXCLUDED.temperature_avg, temperature_max = EXCLUDED.temperature_max,
+    humidity_min = EXCLUDED.humidity_min, humidity_avg = EXCLUDED.humidity_avg, humidity_max = EXCLUDED.humidity_max,
+    iaq_min = EXCLUDED.iaq_min, iaq_avg = EXCLUDED.iaq_avg, iaq_max = EXCLUDED.iaq_max,
+    co2_min = EXCLUDED.co2_min, co2_avg = EXCLUDED.co2_avg, co2_max = EXCLUDED.co2_max,
+    gas_min = EXCLUDED.gas_min, gas_avg = EXCLUDED.gas_avg, gas_max = EXCLUDED.gas_max,
+    battery_min = EXCLUDED.battery_min, battery_avg = EXCLUDED.battery_avg, battery_max = EXCLUDED.battery_max;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention policy: drops the raw partitions that end before older_than, the rollups are kept.
+-- Returns the number of dropped partitions.
+CREATE OR REPLACE FUNCTION sensor_data_drop_partitions(older_than TIMESTAMPTZ) RETURNS INT AS $$
+DECLARE
+  partition_name TEXT;
+  dropped INT := 0;
+BEGIN
+  FOR partition_name IN
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'sensor_data'::regclass
+  LOOP
+    IF (to_date(substring(partition_name FROM '\d{4}_\d{2}$'), 'YYYY_MM') + interval '1 month') AT TIME ZONE 'UTC' <= older_than THEN
+      EXECUTE format('DROP TABLE %I', partition_name);
+      dropped := dropped + 1;
+    END IF;
+  END LOOP;
+  RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
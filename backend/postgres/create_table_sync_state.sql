@@ -0,0 +1,4 @@
+CREATE TABLE sync_state (
+  measurement TEXT PRIMARY KEY NOT NULL,
+  last_synced_time TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,26 @@
+-- Migrates a sensor_data table of the old layout (timestamp INT PRIMARY KEY, no device)
+-- to the partitioned (device_id, ts) layout. Run with psql from this folder:
+--   psql -U test -d db -f migrate_sensor_data_partitioned.sql
+-- The old rows are attributed to the device 'legacy'.
+BEGIN;
+
+ALTER TABLE sensor_data RENAME TO sensor_data_legacy;
+ALTER TABLE sensor_data_legacy RENAME CONSTRAINT sensor_data_pkey TO sensor_data_legacy_pkey;
+
+\ir create_table_sensor_data.sql
+
+SELECT sensor_data_ensure_partitions(to_timestamp(min(timestamp)), to_timestamp(max(timestamp)))
+FROM sensor_data_legacy
+HAVING count(*) > 0;
+
+INSERT INTO sensor_data (device_id, ts, temperature, humidity, iaq, co2, gas, battery)
+SELECT 'legacy', to_timestamp(timestamp), temperature, humidity, iaq, co2, gas, battery
+FROM sensor_data_legacy;
+
+SELECT sensor_data_refresh_rollups(to_timestamp(min(timestamp)), to_timestamp(max(timestamp)))
+FROM sensor_data_legacy
+HAVING count(*) > 0;
+
+DROP TABLE sensor_data_legacy;
+
+COMMIT;
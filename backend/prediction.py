@@ -0,0 +1,97 @@
+"""
+This module contains the service that predicts the power consumption from the weather forecast.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+# Features the model was trained on, in training order
+WEATHER_FEATURES = ["temp", "humidity", "windspeed", "winddir", "cloudcover", "uvindex"]
+
+
+class PredictionService:
+    """
+    Serves the predictions of the trained consumption model.
+    The model is deserialized once and reloaded only when the file changes; its version is the hash of the file.
+    The metadata written next to it by ai/train.py (feature schema, metrics, timings) is required, checked
+and kept in model_metadata.
+    Predictions are cached by model version and forecast content, so a repeated request is a dictionary
+    lookup and a new forecast costs a single batched predict call.
+    """
+
+    def __init__(self, model_path, max_cached_forecasts=16):
+        self.model_path = model_path
+        self.max_cached_forecasts = max_cached_forecasts
+        self.model = None
+        self.model_version = None
+        self.model_metadata = None
+        self.model_mtime = None
+        self.cache = OrderedDict()
+        self.load_model()
+
+    def load_model(self):
+        """
+        Deserializes the model file and drops the predictions of the previous model.
+        """
+        with open(self.model_path, "rb") as f:
+            content = f.read()
+        version = hashlib.sha256(content).hexdigest()[:12]
+        metadata = self.read_metadata(version)
+        model = pickle.loads(content)
+        if model.n_features_in_ != len(WEATHER_FEATURES):
+            raise ValueError(f"The model expects {model.n_features_in_} features, the forecast has {len(WEATHER_FEATURES)}.")
+
+        self.model = model
+        self.model_version = version
+        self.model_metadata = metadata
+        self.model_mtime = os.stat(self.model_path).st_mtime_ns
+        self.cache.clear()
+        print(f"Loaded model {self.model_path} version {self.model_version}")
+        print(f"Model trained {metadata['created']} on {metadata['source']['rows']} rows, cross-validated MSE {metadata['cv']['mse']:.3f}")
+
+    def read_metadata(self, version):
+        """
+        Returns the metadata of the model file. A model without metadata of its version, or trained on
+        other features than WEATHER_FEATURES, is rejected: its expected input is unknown.
+        """
+        path = os.path.splitext(self.model_path)[0] + ".json"
+        try:
+            with open(path) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"The model {self.model_path} has no metadata {path}, train it with ai/train.py.")
+        if metadata.get("version") != version:
+            raise ValueError(f"{path} describes model version {metadata.get('version')}, not {version}.")
+        if metadata["features"] != WEATHER_FEATURES:
+            raise ValueError(f"The model was trained on {', '.join(metadata['features'])}, the forecast has {', '.join(WEATHER_FEATURES)}.")
+        return metadata
+
+    def refresh_model(self):
+        """
+        Reloads the model if its file was replaced since it was loaded.
+        """
+        if os.stat(self.model_path).st_mtime_ns != self.model_mtime:
+            self.load_model()
+
+    def predict(self, forecast_rows):
+        """
+        Returns the predicted consumption for every forecast row, in the same order.
+        """
+        self.refresh_model()
+        features = np.array([[row[name] for name in WEATHER_FEATURES] for row in forecast_rows], dtype=float)
+        key = (self.model_version, hashlib.sha256(features.tobytes()).hexdigest())
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        predictions = self.model.predict(features).tolist() if len(features) else []
+        self.cache[key] = predictions
+        if len(self.cache) > self.max_cached_forecasts:
+            self.cache.popitem(last=False)
+        return predictions
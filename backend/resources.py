@@ -0,0 +1,89 @@
+"""
+This module contains the provider of the clients shared by the backend: the InfluxDB query API,
+the PostgreSQL pool and the prediction model.
+Every client is created on first use and its library is only imported then, so importing the backend
+stays cheap and needs no credentials. The app lifespan owns the provider and closes what it created.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class Resources:
+    """
+    Creates the shared clients on first use. Clients passed to the constructor are used as they are,
+    which lets a caller provide its own, e.g. the stand-ins of the benchmarks.
+    """
+
+    def __init__(self, settings, pg_pool=None, query_api=None, predictor=None):
+        self.settings = settings
+        self.pg_pool = pg_pool
+        self.query_api = query_api
+        self.predictor = predictor
+        self.influx_client = None
+        self.owned = []
+        self.pool_lock = asyncio.Lock()
+        # long reads leave the other connections of the pool to the short queries and the jobs
+        self.stream_slots = asyncio.Semaphore(settings.POSTGRES_POOL_MAX_STREAMS)
+
+    async def get_pg_pool(self):
+        async with self.pool_lock:
+            if self.pg_pool is None:
+                import asyncpg
+
+                self.pg_pool = await asyncpg.create_pool(
+                    self.settings.postgres_connection_string,
+                    min_size=self.settings.POSTGRES_POOL_MIN_SIZE,
+                    max_size=self.settings.POSTGRES_POOL_MAX_SIZE,
+                )
+                self.owned.append(self.pg_pool)
+        return self.pg_pool
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Acquires a connection from the pool, like asyncpg's Pool.acquire().
+        """
+        pool = await self.get_pg_pool()
+        async with pool.acquire() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def acquire_stream(self):
+        """
+        Acquires a pooled connection held as long as a client streams, e.g. a streamed response or an upload.
+        At most POSTGRES_POOL_MAX_STREAMS such connections are out at once, the next readers wait for one.
+        """
+        async with self.stream_slots:
+            async with self.acquire() as conn:
+                yield conn
+
+    async def connect(self):
+        """
+        Opens a dedicated connection outside the pool, e.g. to LISTEN; the caller closes it.
+        """
+        import asyncpg
+
+        return await asyncpg.connect(self.settings.postgres_connection_string)
+
+    def get_query_api(self):
+        if self.query_api is None:
+            from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+
+            self.influx_client = InfluxDBClientAsync(url=self.settings.INFLUXDB_URL, token=self.settings.INFLUXDB_TOKEN,
+                                                     org=self.settings.INFLUXDB_ORG)
+            self.owned.append(self.influx_client)
+            self.query_api = self.influx_client.query_api()
+        return self.query_api
+
+    def get_predictor(self):
+        if self.predictor is None:
+            from prediction import PredictionService
+
+            self.predictor = PredictionService(self.settings.MODEL_PATH)
+        return self.predictor
+
+    async def close(self):
+        for client in reversed(self.owned):
+            await client.close()
+        self.owned = []
@@ -0,0 +1,152 @@
+"""
+This module contains the scheduler that runs the periodic jobs of the backend inside the app lifespan.
+"""
+
+import asyncio
+import time
+import zlib
+from datetime import datetime, timezone
+
+import metrics
+
+# Outcomes a job reports after a run, they decide when it runs next
+IDLE = "idle"          # nothing to do, the interval doubles up to the maximum
+ACTIVE = "active"      # found work, the interval returns to the minimum
+BACKLOG = "backlog"    # more work is pending, the job runs again right away
+SKIPPED = "skipped"    # another worker holds the lock of an exclusive job, it backs off like an idle one
+
+
+class Job:
+    """
+    A periodic job and its run statistics.
+    func is a coroutine function returning (outcome, details); the details of the last run are kept for the status.
+    An exclusive job also holds a PostgreSQL advisory lock while it runs, so only one of several
+    API workers sharing the database runs it at a time. Its func is called with the connection holding
+    the lock and must use that one: a second pooled connection per run could exhaust a small pool.
+    """
+
+    def __init__(self, name, func, min_interval, max_interval, exclusive):
+        self.name = name
+        self.func = func
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.exclusive = exclusive
+        # the key of the advisory lock must be the same in every worker
+        self.lock_key = zlib.crc32(f"scheduler:{name}".encode())
+        self.lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.interval = min_interval
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_outcome = None
+        self.last_details = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            "name": self.name,
+            "running": self.lock.locked(),
+            "exclusive": self.exclusive,
+            "interval": self.interval,
+            "next_run": self.next_run,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_started": self.last_started,
+            "last_duration": self.last_duration,
+            "last_outcome": self.last_outcome,
+            "last_details": self.last_details,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    """
+    Runs every registered job in its own task. A job never overlaps itself: runs are serialized by
+    a lock per job, and exclusive jobs also by an advisory lock across processes.
+    The interval adapts to the outcome of each run: it drops to the minimum when the job found work,
+    to zero while a backlog is pending, and doubles up to the maximum when the job was idle or failed.
+    db hands out the connections of the advisory locks through acquire(), like an asyncpg pool.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.jobs = {}
+        self.tasks = []
+
+    def add_job(self, name, func, min_interval, max_interval, exclusive=False):
+        self.jobs[name] = Job(name, func, min_interval, max_interval, exclusive)
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.job_loop(job)) for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def wake(self, name):
+        """
+        Runs the job as soon as possible instead of waiting for its interval.
+        """
+        self.jobs[name].wakeup.set()
+
+    async def run(self, name):
+        """
+        Runs the job now, after its current run if there is one, and returns the details of the run.
+        """
+        return await self.run_job(self.jobs[name])
+
+    async def run_job(self, job):
+        async with job.lock:
+            job.wakeup.clear()
+            job.last_started = datetime.now(timezone.utc)
+            started = time.perf_counter()
+            try:
+                if job.exclusive:
+                    async with self.db.acquire() as conn:
+                        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", job.lock_key):
+                            # another worker is running it, wait for the next turn
+                            job.skipped += 1
+                            job.last_outcome, job.last_details = SKIPPED, None
+                        else:
+                            try:
+                                job.last_outcome, job.last_details = await job.func(conn)
+                            finally:
+                                await conn.execute("SELECT pg_advisory_unlock($1)", job.lock_key)
+                else:
+                    job.last_outcome, job.last_details = await job.func()
+                job.last_error = None
+            except Exception as e:
+                print(f"Job {job.name} failed: {e}")
+                job.failures += 1
+                job.last_outcome, job.last_details = None, None
+                job.last_error = str(e)
+            job.runs += 1
+            job.last_duration = time.perf_counter() - started
+            metrics.JOB_SECONDS.labels(job.name, job.last_outcome or "failed").observe(job.last_duration)
+
+            if job.last_outcome == BACKLOG:
+                job.interval = 0
+            elif job.last_outcome == ACTIVE:
+                job.interval = job.min_interval
+            else:
+                job.interval = min(max(job.interval, job.min_interval) * 2, job.max_interval)
+            return job.last_details
+
+    async def job_loop(self, job):
+        while True:
+            await self.run_job(job)
+            job.next_run = datetime.fromtimestamp(time.time() + job.interval, timezone.utc)
+            try:
+                await asyncio.wait_for(job.wakeup.wait(), timeout=job.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def status(self):
+        return [job.status() for job in self.jobs.values()]
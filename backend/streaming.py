@@ -0,0 +1,76 @@
+"""
+This module contains the encoders used to stream query results out of the API.
+Every encoder takes the selected table columns and an async iterator over batches of rows
+and yields the encoded response body batch by batch, so memory does not grow with the result size.
+"""
+
+import io
+import json
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def load_arrow():
+    """
+    Returns the pyarrow module, or None if the optional dependency is not installed.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+async def encode_json(columns, batches):
+    """
+    Encodes the rows as a single JSON array of objects, the format the API always returned.
+    """
+    names = [column.name for column in columns]
+    separator = "["
+    async for rows in batches:
+        chunk = ",".join(json.dumps(dict(zip(names, row))) for row in rows)
+        yield separator + chunk
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+async def encode_ndjson(columns, batches):
+    """
+    Encodes the rows as newline delimited JSON, one object per line.
+    """
+    names = [column.name for column in columns]
+    async for rows in batches:
+        yield "".join(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+
+
+async def encode_arrow(columns, batches):
+    """
+    Encodes the rows as an Arrow IPC stream with one record batch per batch of rows.
+    The schema is derived from the column types, so it is fixed even if a batch only holds NULLs.
+    """
+    pa = load_arrow()
+    arrow_types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    schema = pa.schema([(column.name, arrow_types[column.type.python_type]) for column in columns])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    async for rows in batches:
+        arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+
+    writer.close()
+    yield sink.getvalue()
+
+
+ENCODERS = {
+    "json": encode_json,
+    "ndjson": encode_ndjson,
+    "arrow": encode_arrow,
+}
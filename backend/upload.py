@@ -0,0 +1,150 @@
+"""
+This module contains the parsing and validation of the CSV files uploaded to /upload.
+The body is decoded and split into rows as it arrives, so a file of any size is processed in constant memory.
+"""
+
+import codecs
+import csv
+import math
+from datetime import datetime, timezone
+
+from fastapi.responses import StreamingResponse
+
+
+async def iter_csv_rows(chunks):
+    """
+    Yields (line number, fields) for every non-empty line of a CSV body given as an async iterator of byte chunks.
+    The delimiter (comma or semicolon) is detected on the header line. Every record must fit on one line.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    iterator = chunks.__aiter__()
+    pending = ""
+    line_number = 0
+    delimiter = None
+    final = False
+    while not final:
+        try:
+            text = pending + decoder.decode(await iterator.__anext__())
+        except StopAsyncIteration:
+            text = pending + decoder.decode(b"", final=True)
+            final = True
+        # the last line of a chunk may continue in the next one
+        lines = text.split("\n")
+        pending = "" if final else lines.pop()
+        if delimiter is None:
+            header = next((line for line in lines if line.strip()), None)
+            if header is None:
+                line_number += len(lines)
+                continue
+            delimiter = ";" if header.count(";") > header.count(",") else ","
+        # one reader per chunk rather than per line
+        for row in csv.reader(lines, delimiter=delimiter):
+            line_number += 1
+            if len(row) > 1 or row and row[0].strip():
+                yield line_number, row
+
+
+def parse_float(value, column):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    # DECIMAL(precision, scale) columns hold less than 10 ** (precision - scale)
+    precision, scale = getattr(column.type, "precision", None), getattr(column.type, "scale", None)
+    if precision is not None and scale is not None:
+        number = round(number, scale)
+        if abs(number) >= 10 ** (precision - scale):
+            raise ValueError(f"{value} is out of range")
+    return number
+
+
+def parse_int(value, column):
+    try:
+        number = int(value)
+    except ValueError:
+        # integers written as floats, e.g. by pandas for a column with missing values
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{value} is not an integer")
+    if not -2**31 <= number < 2**31:
+        raise ValueError(f"{value} is out of range")
+    return int(number)
+
+
+def parse_timestamp(value, column):
+    """
+    Parses a unix timestamp in seconds or an ISO 8601 date; dates without a time zone are taken as UTC.
+    """
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    try:
+        return datetime.fromtimestamp(seconds, timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError(f"{value} is out of range")
+
+
+def parse_str(value, column):
+    return value
+
+
+PARSERS = {float: parse_float, int: parse_int, datetime: parse_timestamp, str: parse_str}
+
+
+class RowValidator:
+    """
+    Maps the header of an upload onto the columns of a table and converts every row into a record
+    in column order. A column can be read from any of its aliases or take a default value;
+    header columns that match no table column are ignored.
+    """
+
+    def __init__(self, header, columns, aliases=None, defaults=None):
+        aliases = aliases or {}
+        defaults = defaults or {}
+        names = [name.strip().lower() for name in header]
+        self.columns = columns
+        self.positions = []
+        missing = []
+        for column in columns:
+            candidates = [column.name] + aliases.get(column.name, [])
+            position = next((names.index(name) for name in candidates if name in names), None)
+            if position is None and column.name not in defaults and not column.nullable:
+                missing.append(column.name)
+            self.positions.append(position)
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}.")
+
+        self.defaults = [defaults.get(column.name) for column in columns]
+        self.parsers = [PARSERS[column.type.python_type] for column in columns]
+        used = {position for position in self.positions if position is not None}
+        self.ignored = [name for i, name in enumerate(header) if i not in used]
+
+    def convert(self, row):
+        """
+        Returns the record of the row, or raises ValueError naming the first invalid column.
+        """
+        record = []
+        for column, position, default, parse in zip(self.columns, self.positions, self.defaults, self.parsers):
+            value = row[position].strip() if position is not None and position < len(row) else ""
+            if not value:
+                if default is None and not column.nullable:
+                    raise ValueError(f"{column.name} is required")
+                record.append(default)
+                continue
+            try:
+                record.append(parse(value, column))
+            except ValueError as e:
+                raise ValueError(f"{column.name}: {e}")
+        return tuple(record)
+
+
+class UploadResponse(StreamingResponse):
+    """
+    Streaming response whose body iterator still reads the request body. A StreamingResponse watches
+    the receive channel for a disconnect while it streams, which would swallow the chunks of the upload,
+    so this one only streams; a disconnected client ends the upload when the body stops arriving.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
@@ -0,0 +1,93 @@
+"""
+Measures the latency of /get_sensor_data while the ETL (/fetch_data_and_store) runs concurrently.
+
+Start the backend (uvicorn main:app from the backend folder), then run:
+
+    python benchmarks/api_latency_under_etl.py --url http://localhost:8000 --duration 30
+
+The script first measures the read latency alone, then again while the ETL endpoint is called
+back to back, and prints both runs as JSON. Run it against the revision before and after a change
+to compare the p99 latency of the reads under load.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+
+
+def percentile(samples, q):
+    """
+    Returns the q-th percentile (0-100) of the samples using the nearest-rank method.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+async def reader(session, url, timestamp, deadline, latencies):
+    """
+    Calls /get_sensor_data in a loop until the deadline and records every latency in milliseconds.
+    """
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with session.get(f"{url}/get_sensor_data", params={"timestamp": timestamp}) as response:
+            await response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def etl(session, url, deadline, runs):
+    """
+    Calls /fetch_data_and_store back to back until the deadline.
+    """
+    while time.perf_counter() < deadline:
+        async with session.get(f"{url}/fetch_data_and_store") as response:
+            await response.read()
+        runs.append(1)
+
+
+async def run_scenario(url, duration, readers, window, with_etl):
+    """
+    Runs the given number of concurrent readers for the duration, optionally with the ETL in the background.
+    """
+    latencies = []
+    etl_runs = []
+    deadline = time.perf_counter() + duration
+    timestamp = int(time.time()) - window
+    async with aiohttp.ClientSession() as session:
+        tasks = [reader(session, url, timestamp, deadline, latencies) for _ in range(readers)]
+        if with_etl:
+            tasks.append(etl(session, url, deadline, etl_runs))
+        await asyncio.gather(*tasks)
+
+    return {
+        "with_etl": with_etl,
+        "requests": len(latencies),
+        "etl_runs": len(etl_runs),
+        "mean_ms": statistics.fmean(latencies) if latencies else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+
+async def main(args):
+    report = []
+    for with_etl in (False, True):
+        report.append(await run_scenario(args.url, args.duration, args.readers, args.window, with_etl))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per scenario")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent /get_sensor_data clients")
+    parser.add_argument("--window", type=int, default=3600, help="seconds of data requested per read")
+    asyncio.run(main(parser.parse_args()))
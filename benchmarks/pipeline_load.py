@@ -0,0 +1,241 @@
+"""
+End-to-end load benchmark of the hub, the ETL and the sensor data API with synthetic data and
+in-process stand-ins for InfluxDB and PostgreSQL, so it runs without a Nicla, a Pi or any service.
+
+    python benchmarks/pipeline_load.py --devices 8 --hz 10 --output report.json
+
+Scenarios:
+- hub_parse: to_lines() over pre-built packets, the parse throughput of the writer task.
+- hub_pipeline: N virtual devices notify at M samples per second through notification_handler for
+  --duration seconds; the BatchWriter parses, spools and writes them to a stand-in write API.
+  Reports the achieved rates, dropped and invalid packets and the notify-to-write latency.
+- etl: query_fluxdb() syncs --etl-seconds of data of N devices at M Hz from a stand-in query API
+  into a stand-in pool until it caught up. Reports rows/s and the time spent in every stage.
+- api: /get_sensor_data reads the whole table in every format at growing table sizes.
+  Reports the latency percentiles per size and format.
+
+The report is JSON, with the git revision and the parameters, so runs of two revisions can be diffed.
+The stand-ins keep the data in memory (see standins.py): the numbers measure the pipeline code, not
+the databases; use api_latency_under_etl.py against a running stack for those.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from api_latency_under_etl import percentile
+from standins import FakePool, FakeQueryApi, FakeWriteApi, influx_frame
+from synthetic import ROOT, PacketGenerator
+
+# the hub reads its settings on import, and the backend stand-ins never use the credentials
+for name, value in [("INFLUXDB_URL", "http://localhost:8086"), ("INFLUXDB_ORG", "benchmark"), ("INFLUXDB_BUCKET", "benchmark"),
+                    ("INFLUXDB_TOKEN", "benchmark")]:
+    os.environ.setdefault(name, value)
+
+
+def import_main(directory):
+    """
+    Imports the main module of the hub or the backend. Both folders hold a main and a metrics module,
+    so the ones of the previous import are dropped from the module cache first.
+    """
+    for name in ("main", "metrics"):
+        sys.modules.pop(name, None)
+    sys.path.insert(0, directory)
+    try:
+        return importlib.import_module("main")
+    finally:
+        sys.path.remove(directory)
+
+
+def summary_ms(samples):
+    samples = [sample * 1000 for sample in samples]
+    return {
+        "mean_ms": statistics.fmean(samples) if samples else None,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples) if samples else None,
+    }
+
+
+def bench_hub_parse(hub, args):
+    import batch_writer
+
+    generator = PacketGenerator(args.devices, args.hz, args.samples_per_packet, seed=args.seed)
+    packets = [(generator.devices[i % args.devices], generator.packet(i % args.devices)) for i in range(args.parse_packets)]
+    received_ns = time.time_ns()
+    start = time.perf_counter()
+    lines = sum(len(batch_writer.to_lines("movement_sensor_data", device, received_ns, data)) for device, data in packets)
+    elapsed = time.perf_counter() - start
+    return {"packets": len(packets), "samples": lines, "seconds": elapsed,
+            "packets_per_second": len(packets) / elapsed, "samples_per_second": lines / elapsed}
+
+
+async def bench_hub_pipeline(hub, args):
+    from batch_writer import BatchWriter
+    from spool import Spool
+
+    generator = PacketGenerator(args.devices, args.hz, args.samples_per_packet, seed=args.seed)
+    write_api = FakeWriteApi(latency=args.write_latency)
+    with tempfile.TemporaryDirectory() as directory:
+        spool = Spool(os.path.join(directory, "spool.sqlite3"), hub.SPOOL_MAX_LINES)
+        writer = BatchWriter(write_api, "benchmark", "benchmark", "movement_sensor_data", spool,
+                             max_queue_size=hub.WRITE_QUEUE_SIZE, batch_size=hub.WRITE_BATCH_SIZE, flush_interval=hub.WRITE_FLUSH_INTERVAL,
+                             replay_batch_size=hub.REPLAY_BATCH_SIZE, replay_rate=hub.REPLAY_RATE)
+        devices = [hub.DeviceState(address) for address in generator.devices]
+        tasks = [asyncio.create_task(writer.run()), asyncio.create_task(writer.flush_loop())]
+
+        # every device notifies once per packet period, the notifications of a period are spread evenly
+        period = args.samples_per_packet / args.hz
+        start = time.perf_counter()
+        notified = 0
+        while time.perf_counter() - start < args.duration:
+            for i, device in enumerate(devices):
+                hub.notification_handler(writer, device, 0, generator.packet(i))
+                notified += 1
+                await asyncio.sleep(max(0.0, start + notified * period / len(devices) - time.perf_counter()))
+        notify_seconds = time.perf_counter() - start
+
+        # wait until every sample was written, dropped or rejected
+        expected = notified * args.samples_per_packet
+        deadline = time.perf_counter() + 60
+        while write_api.lines + (writer.dropped + writer.invalid) * args.samples_per_packet < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        drained_seconds = time.perf_counter() - start
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        spool.close()
+
+    return dict({
+        "devices": args.devices, "hz": args.hz, "samples_per_packet": args.samples_per_packet,
+        "packets": notified, "notify_seconds": notify_seconds, "drain_seconds": drained_seconds,
+        "packets_per_second": notified / notify_seconds, "lines_written": write_api.lines,
+        "lines_per_second": write_api.lines / drained_seconds, "writes": write_api.writes,
+        "dropped": writer.dropped, "invalid": writer.invalid,
+    }, **{f"notify_to_write_{key}": value for key, value in summary_ms(write_api.notify_to_write).items()})
+
+
+def stage_seconds(registry, name):
+    return registry.get_sample_value(f"{name}_sum") or 0.0
+
+
+async def bench_etl(backend, args):
+    from prometheus_client import REGISTRY
+    from scheduler import BACKLOG, Scheduler
+
+    horizon = time.time() - backend.get_settings().SYNC_SETTLE_SECONDS
+    start = horizon - args.etl_seconds
+    frame = influx_frame(args.devices, args.hz, start, args.etl_seconds, backend.SENSOR_FIELDS, args.seed)
+    pool = FakePool(backend.SENSOR_FIELDS)
+    pool.watermarks[backend.MEASUREMENT] = datetime.fromtimestamp(start, timezone.utc)
+    backend.app.state.resources = backend.Resources(backend.get_settings(), pg_pool=pool, query_api=FakeQueryApi(frame))
+    backend.app.state.scheduler = Scheduler(pool)
+    backend.app.state.scheduler.add_job("sensor_sync", backend.sync_sensor_data, 0, 0, exclusive=True)
+    job = backend.app.state.scheduler.jobs["sensor_sync"]
+
+    stages = ("etl_influx_query_seconds", "etl_pivot_seconds", "etl_db_write_seconds")
+    before = {name: stage_seconds(REGISTRY, name) for name in stages}
+    inserted = 0
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        result = await backend.query_fluxdb()
+        runs += 1
+        inserted += result.get("inserted", 0)
+        if job.last_outcome != BACKLOG:
+            break
+    elapsed = time.perf_counter() - started
+
+    return {
+        "devices": args.devices, "hz": args.hz, "seconds_of_data": args.etl_seconds, "rows": len(frame),
+        "inserted": inserted, "runs": runs, "error": job.last_error, "seconds": elapsed, "rows_per_second": inserted / elapsed,
+        "stage_seconds": {name: stage_seconds(REGISTRY, name) - before[name] for name in stages},
+    }
+
+
+async def bench_api(backend, args):
+    formats = ["json", "ndjson"] + (["arrow"] if backend.streaming.load_arrow() else [])
+    results = []
+    for size in args.table_sizes:
+        pool = FakePool(backend.SENSOR_FIELDS)
+        seconds = size / (args.devices * args.hz)
+        start = time.time() - seconds
+        pool.load(args.devices, args.hz, start, seconds, args.seed)
+        backend.app.state.resources = backend.Resources(backend.get_settings(), pg_pool=pool)
+        for output in formats:
+            latencies = []
+            for _ in range(args.api_requests):
+                began = time.perf_counter()
+                response = await backend.query_sensor_data_postgres(timestamp=start, end=None, limit=None, cursor=None, columns=None,
+                                                                    device_id=None, output=output)
+                async for _ in response.body_iterator:
+                    pass
+                latencies.append(time.perf_counter() - began)
+            results.append(dict({"rows": len(pool.rows), "format": output, "requests": len(latencies)}, **summary_ms(latencies)))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    report = {
+        "revision": git_revision(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "scenarios": {},
+    }
+    # the pipeline logs every sync run and hub report, keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if {"hub_parse", "hub_pipeline"} & set(args.scenarios):
+            hub = import_main(os.path.join(ROOT, "Raspberry"))
+            if "hub_parse" in args.scenarios:
+                report["scenarios"]["hub_parse"] = bench_hub_parse(hub, args)
+            if "hub_pipeline" in args.scenarios:
+                report["scenarios"]["hub_pipeline"] = await bench_hub_pipeline(hub, args)
+        if {"etl", "api"} & set(args.scenarios):
+            backend = import_main(os.path.join(ROOT, "backend"))
+            if "etl" in args.scenarios:
+                report["scenarios"]["etl"] = await bench_etl(backend, args)
+            if "api" in args.scenarios:
+                report["scenarios"]["api"] = await bench_api(backend, args)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["hub_parse", "hub_pipeline", "etl", "api"],
+                        choices=["hub_parse", "hub_pipeline", "etl", "api"])
+    parser.add_argument("--devices", type=int, default=8, help="virtual devices")
+    parser.add_argument("--hz", type=float, default=10, help="samples per second of every device")
+    parser.add_argument("--samples-per-packet", type=int, default=1, help="samples packed into one notification")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of notifications of hub_pipeline")
+    parser.add_argument("--write-latency", type=float, default=0.005, help="seconds taken by every stand-in InfluxDB write")
+    parser.add_argument("--parse-packets", type=int, default=100_000, help="packets parsed by hub_parse")
+    parser.add_argument("--etl-seconds", type=float, default=3600, help="seconds of data synced by etl")
+    parser.add_argument("--table-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="sensor_data rows of api")
+    parser.add_argument("--api-requests", type=int, default=20, help="requests per size and format of api")
+    parser.add_argument("--output", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,173 @@
+"""
+In-process stand-ins for InfluxDB and PostgreSQL used by the benchmarks.
+
+They keep the data in memory and only understand the calls the pipeline makes, so the benchmarks
+measure the code of the hub and the backend rather than the network or the databases. Use
+api_latency_under_etl.py against a running stack to measure the databases as well.
+"""
+
+import bisect
+import re
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+
+from synthetic import sensor_samples
+
+
+class FakeWriteApi:
+    """
+    Synchronous InfluxDB write API that counts the lines and records how long after its
+    notification every line was written. latency is an optional delay per write in seconds.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lines = 0
+        self.writes = 0
+        self.notify_to_write = []
+
+    def write(self, bucket, org, record):
+        if self.latency:
+            time.sleep(self.latency)
+        written_ns = time.time_ns()
+        self.writes += 1
+        self.lines += len(record)
+        self.notify_to_write.extend((written_ns - int(line.rsplit(" ", 1)[1])) / 1e9 for line in record)
+
+
+def influx_frame(devices, hz, start, seconds, fields, seed=0):
+    """
+    Returns what query_data_frame yields for the pivoted sensor query: one row per device and sample time
+    from start (a unix timestamp) for the given seconds, ordered by time.
+    """
+    count = int(seconds * hz)
+    samples = sensor_samples(devices, count, seed)
+    times = pd.to_datetime(start + np.arange(count) / hz, unit="s", utc=True)
+    frame = pd.DataFrame({
+        "result": "_result",
+        "table": 0,
+        "_time": np.repeat(times, devices),
+        "device_id": np.tile([f"device-{i}" for i in range(devices)], count),
+    })
+    for field in fields:
+        frame[field] = samples[field].T.reshape(-1)
+    return frame
+
+
+class FakeQueryApi:
+    """
+    Async InfluxDB query API answering the range() of a Flux query from a prepared frame.
+    """
+
+    range_pattern = re.compile(r"range\(start: (\S+), stop: (\S+)\)")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.times = frame["_time"].to_numpy(dtype="datetime64[ns]")
+
+    async def query_data_frame(self, query, org=None):
+        start, stop = (np.datetime64(value.rstrip("Z")) for value in self.range_pattern.search(query).groups())
+        first, last = np.searchsorted(self.times, [start, stop])
+        # the client parses a fresh frame out of every response
+        return self.frame.iloc[first:last].copy()
+
+
+class FakeConnection:
+    """
+    asyncpg connection over the in-memory tables of a FakePool.
+    Reads through cursor() return the rows from the first argument (a unix timestamp) on, in the
+    column order of the API; the other filters of the query are ignored.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def execute(self, sql, *args):
+        if "INSERT INTO sync_state" in sql:
+            self.pool.watermarks[args[0]] = args[1]
+        return "SELECT 1"
+
+    async def fetch(self, sql, *args):
+        if "INSERT INTO sensor_data" in sql:
+            return self.pool.insert(args)
+        return []
+
+    async def fetchval(self, sql, *args):
+        if "FROM sync_state" in sql:
+            return self.pool.watermarks.get(args[0])
+        if "pg_try_advisory_lock" in sql:
+            return True
+        return None
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def cursor(self, sql, *args):
+        return FakeCursor(*self.pool.rows_from(args[0]))
+
+
+class FakeCursor:
+
+    def __init__(self, rows, position):
+        self.rows = rows
+        self.position = position
+
+    async def fetch(self, n):
+        rows = self.rows[self.position:self.position + n]
+        self.position += n
+        return rows
+
+
+class FakePool:
+    """
+    asyncpg pool holding sensor_data as a dict keyed by (device_id, ts) and sync_state as a dict.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.rows = {}
+        self.watermarks = {}
+        self.ordered = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self)
+
+    def insert(self, columns):
+        """
+        Inserts the unnest() arrays of insert_sensor_rows, skipping stored keys. Returns the keys of the inserted rows,
+        like its RETURNING clause.
+        """
+        inserted = []
+        for device_id, ts, *values in zip(*columns):
+            key = (device_id, ts.timestamp())
+            if key not in self.rows:
+                self.rows[key] = tuple(values)
+                inserted.append((device_id, ts))
+        if inserted:
+            self.ordered = None
+        return inserted
+
+    def load(self, devices, hz, start, seconds, seed=0):
+        """
+        Fills sensor_data with synthetic rows without going through the ETL.
+        """
+        frame = influx_frame(devices, hz, start, seconds, self.fields, seed)
+        timestamps = frame["_time"].astype("int64").to_numpy() / 1e9
+        values = zip(*(frame[field].tolist() for field in self.fields))
+        self.rows.update(((device_id, ts), row) for device_id, ts, row in zip(frame["device_id"], timestamps, values))
+        self.ordered = None
+
+    def rows_from(self, timestamp):
+        """
+        Returns the rows in API column order (device_id, timestamp, fields) sorted by time and device,
+        and the index of the first row at or after the timestamp.
+        """
+        if self.ordered is None:
+            self.ordered = sorted(((device_id, ts) + values for (device_id, ts), values in self.rows.items()), key=lambda row: (row[1], row[0]))
+            self.ordered_times = [row[1] for row in self.ordered]
+        return self.ordered, bisect.bisect_left(self.ordered_times, timestamp)
@@ -0,0 +1,105 @@
+"""
+Measures the cold start of the backend: the time a fresh interpreter takes to import main, which every
+uvicorn worker pays when it is spawned, and optionally the time until uvicorn with several workers
+answers its first request.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --uvicorn-workers 4
+
+The import runs without any credentials in the environment, so it also checks that importing the
+backend has no side effects. The uvicorn measurement starts the app lifespan, which connects to the
+PostgreSQL database configured in backend/.env. Pass --backend with the backend folder of another
+checkout (e.g. a git worktree of an older revision) to compare two revisions. Prints the report as JSON.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# environment of the import runs, without the settings of the backend
+CLEAN_ENV = {name: os.environ[name] for name in ("PATH", "HOME", "SYSTEMROOT", "VIRTUAL_ENV") if name in os.environ}
+
+
+def import_seconds(backend):
+    """
+    Imports main in a fresh interpreter and returns the seconds it took, or raises with its stderr.
+    """
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=backend, env=CLEAN_ENV, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout)
+
+
+def slowest_imports(backend, count=10):
+    """
+    Returns the top level modules imported by main with their cumulative import time in milliseconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=backend, env=CLEAN_ENV,
+                            capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # direct imports of main are indented by two spaces
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return dict(sorted(modules, key=lambda module: -module[1])[:count])
+
+
+def uvicorn_seconds(backend, workers, port, timeout):
+    """
+    Starts uvicorn with the given workers and returns the seconds until / answers.
+    """
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers), "--port", str(port)],
+                              cwd=backend, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.05)
+        return None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args):
+    times = [import_seconds(args.backend) for _ in range(args.runs)]
+    report = {
+        "backend": os.path.abspath(args.backend),
+        "import": {
+            "runs": len(times),
+            "median_s": statistics.median(times),
+            "min_s": min(times),
+            "max_s": max(times),
+            "slowest_imports_ms": slowest_imports(args.backend),
+        },
+    }
+    if args.uvicorn_workers:
+        report["uvicorn"] = {
+            "workers": args.uvicorn_workers,
+            "first_response_s": uvicorn_seconds(args.backend, args.uvicorn_workers, args.port, args.timeout),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=os.path.join(ROOT, "backend"), help="backend folder to measure")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters importing main")
+    parser.add_argument("--uvicorn-workers", type=int, default=0, help="also time uvicorn with this many workers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for uvicorn")
+    main(parser.parse_args())
@@ -0,0 +1,79 @@
+"""
+Synthetic sensor data for the benchmarks, seeded from the environment readings of ai/bolzanosynthetic.csv.
+
+Every virtual device replays the temperature and humidity rows of the CSV in a loop, shifted by a
+per-device offset and some seeded noise; the other fields follow plausible indoor ranges. The same
+seed always produces the same data, so two runs of a benchmark see the same input.
+"""
+
+import csv
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_CSV = os.path.join(ROOT, "ai", "bolzanosynthetic.csv")
+sys.path.insert(0, os.path.join(ROOT, "Raspberry"))
+
+# the packets are built with the layout the hub parses, see Arduino/Nicla_BLE_Advertising/sensor_packet.h
+from sensor_packet import HEADER, PACKET_VERSION, SAMPLE  # noqa: E402
+
+
+def load_seed(path=SEED_CSV):
+    """
+    Returns the temperature and humidity columns of the seed CSV as float arrays.
+    """
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    return np.array([float(row["temp"]) for row in rows]), np.array([float(row["humidity"]) for row in rows])
+
+
+def sensor_samples(devices, count, seed=0, path=SEED_CSV):
+    """
+    Returns count samples per device as a dict of arrays of shape (devices, count), one per sensor field.
+    """
+    rng = np.random.default_rng(seed)
+    temp, humidity = load_seed(path)
+    index = np.arange(count) % len(temp)
+    offsets = rng.uniform(-2, 2, size=(devices, 1))
+    return {
+        # indoor temperatures follow the outdoor ones, damped
+        "temperature": np.round(20 + 0.2 * temp[index] + offsets + rng.normal(0, 0.1, (devices, count)), 2),
+        "humidity": np.clip(np.round(0.6 * humidity[index] + rng.normal(0, 1, (devices, count))), 0, 100).astype(int),
+        "pressure": np.round(rng.normal(1013, 2, (devices, count)), 1),
+        "iaq": np.round(np.clip(rng.normal(50, 15, (devices, count)), 0, 500), 2),
+        "co2": rng.integers(400, 1500, (devices, count)),
+        "gas": rng.integers(5_000, 50_000, (devices, count)),
+        "battery": np.full((devices, count), 90),
+    }
+
+
+class PacketGenerator:
+    """
+    Produces the BLE notifications of N virtual devices, each sampling at hz samples per second and
+    packing samples_per_packet samples into a binary packet like the Nicla firmware.
+    """
+
+    def __init__(self, devices, hz, samples_per_packet=1, count=10_000, seed=0):
+        self.devices = [f"SY:NT:HE:TI:C0:{i:02X}" for i in range(devices)]
+        self.hz = hz
+        self.samples_per_packet = samples_per_packet
+        self.count = count
+        self.samples = sensor_samples(devices, count, seed)
+        self.packet_ids = [0] * devices
+
+    def packet(self, device):
+        """
+        Returns the next notification of the device at the given index.
+        """
+        interval_ms = int(1000 / self.hz) if self.hz else 0
+        data = bytearray(HEADER.pack(PACKET_VERSION, self.samples_per_packet, interval_ms))
+        for _ in range(self.samples_per_packet):
+            i = self.packet_ids[device] % self.count
+            s = self.samples
+            data += SAMPLE.pack(self.packet_ids[device], int(s["temperature"][device, i] * 100), int(s["humidity"][device, i]),
+                                int(s["pressure"][device, i] * 10), int(s["iaq"][device, i] * 100), int(s["co2"][device, i]),
+                                int(s["gas"][device, i]), int(s["battery"][device, i]))
+            self.packet_ids[device] += 1
+        return data
@@ -1,7 +1,7 @@
+import json
 import requests
 import streamlit as st
 import plotly.graph_objects as go
-import numpy as np
 import pandas as pd
 import time
 
@@ -16,16 +16,32 @@ def local_css(file_name):
 # Apply the custom styles defined in the 'style.css' file
 local_css('style.css')
 
-def fetch_sensor_data():
-    current_unix_timestamp = int(time.time()) - 3600
-    url = f"http://localhost:8000/get_sensor_data/?timestamp={current_unix_timestamp}"
+# Displayed time window of the sensor charts
+WINDOW_SECONDS = 3600
+# Points of every device in a chart, about the width of a chart in pixels: the window is drawn
+# in buckets of CHART_RESOLUTION seconds, so the cost of a redraw does not depend on the sample rate
+CHART_POINTS = 600
+CHART_RESOLUTION = WINDOW_SECONDS // CHART_POINTS
+CHART_FIELDS = ["temperature", "humidity", "co2", "iaq"]
+PREDICTION_REFRESH_SECONDS = 60
+# The charts are redrawn at most this often, the rows pushed in between are only collected
+REDRAW_SECONDS = 5
+
+def fetch_sensor_chart():
+    """Fetch the displayed window as the mean of every field per device and bucket, computed by the backend."""
+    url = "http://localhost:8000/get_sensor_data_downsampled"
+    params = {"timestamp": int(time.time()) - WINDOW_SECONDS, "mode": "bucket", "resolution": CHART_RESOLUTION,
+              "columns": ",".join(CHART_FIELDS)}
     try:
-        response = requests.get(url)
+        response = requests.get(url, params=params)
         response.raise_for_status()
-        return pd.DataFrame(response.json())
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching sensor data: {e}")
         return pd.DataFrame()
+    buckets = pd.DataFrame(response.json())
+    if buckets.empty:
+        return buckets
+    return buckets.rename(columns={f"{field}_mean": field for field in CHART_FIELDS})[["device_id", "timestamp", "samples"] + CHART_FIELDS]
 
 def prediction_power():
     url = f"http://localhost:8000/get_prediction"
@@ -37,44 +53,68 @@ def prediction_power():
         st.error(f"Error fetching sensor data: {e}")
         return pd.DataFrame()
 
+# Tables the backend loads uploaded CSV files into, and the size of the chunks the files are streamed in
+UPLOAD_TABLES = {"Sensor data": "sensor_data", "Weather forecast": "weather_forecast"}
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+def file_chunks(uploaded_file):
+    """Yield the uploaded file in chunks, so requests streams it instead of building one large body."""
+    uploaded_file.seek(0)
+    while True:
+        chunk = uploaded_file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+def upload_csv(uploaded_file, table, replace):
+    """Stream the file to the backend, which validates and loads it, and show its progress. Return the final summary."""
+    url = f"http://localhost:8000/upload/{table}"
+    response = requests.post(url, params={"replace": replace}, data=file_chunks(uploaded_file), stream=True)
+    if response.status_code == 400:
+        raise ValueError(response.json()["detail"])
+    response.raise_for_status()
+    progress = st.empty()
+    summary = None
+    for line in response.iter_lines():
+        if line:
+            summary = json.loads(line)
+            progress.text(f"{summary['rows']} rows read, {summary['loaded']} loaded, {summary['rejected']} rejected")
+    return summary
+
 # Sidebar for file upload
 with st.sidebar:
     st.title("Data Upload")
+    upload_table = UPLOAD_TABLES[st.selectbox("Table", list(UPLOAD_TABLES))]
+    replace_forecast = upload_table == "weather_forecast" and st.checkbox("Replace the current forecast")
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-    if uploaded_file is not None:
+    # Upload on request only, the script reruns on every interaction
+    if uploaded_file is not None and st.button("Upload to database"):
         try:
-            df_uploaded = pd.read_csv(uploaded_file)
-            if df_uploaded.empty:
-                st.error("The uploaded file is empty. Please upload a valid CSV file.")
+            summary = upload_csv(uploaded_file, upload_table, replace_forecast)
+            if summary is None or not summary.get("done"):
+                st.error(f"The upload failed: {summary['error'] if summary else 'no response from the backend'}")
+            elif summary["rows"] == 0:
+                st.error("The uploaded file has no rows. Please upload a valid CSV file.")
             else:
-                st.success("Successfully uploaded to database!")
-                st.dataframe(df_uploaded)
-        except pd.errors.EmptyDataError:
-            st.error("The uploaded CSV file is empty or invalid.")
-        except Exception as e:
-            st.error(f"An error occurred while processing the file: {e}")
-
-# Placeholder for sensor data
-sensor_data_placeholder = st.empty()
-
-while True:
-    # Fetch and display sensor data
-    sensor_data_df = fetch_sensor_data()
-    prediction_power_df = prediction_power()
+                message = f"Uploaded {summary['loaded']} rows to the database"
+                if summary["duplicates"]:
+                    message += f", {summary['duplicates']} were already stored"
+                if summary["rejected"]:
+                    st.warning(f"{message}. {summary['rejected']} invalid rows were skipped:")
+                    st.dataframe(pd.DataFrame(summary["errors"]))
+                else:
+                    st.success(f"{message}!")
+        except ValueError as e:
+            st.error(f"The uploaded file was rejected: {e}")
+        except requests.exceptions.RequestException as e:
+            st.error(f"An error occurred while uploading the file: {e}")
 
+def render_sensor_charts(sensor_data_df):
+    """Redraw the charts of the Square modules from the buffered buckets of sensor data."""
     with sensor_data_placeholder.container():
         if not sensor_data_df.empty:
-            dates = sensor_data_df["timestamp"]
-            temperature = sensor_data_df["temperature"]
-            humidity = sensor_data_df["humidity"]
-            co2_levels = sensor_data_df["co2"]
-            air_quality = sensor_data_df["iaq"]
-            power_consumption = np.random.normal(loc=40, scale=1, size=6)  # Simulate power consumption
-            prediction_power_data = prediction_power_df["kwh"]
-            np.random.seed(42)  # Set the seed value
-            prediction_power_data = np.random.normal(loc=40, scale=5, size=7)  # Simulate power consumption
-            power_consumption =  np.random.normal(loc=40, scale=5, size=7)
-            weather_data =  np.random.normal(loc=13, scale=5, size=7)
+            # One trace per device
+            devices = list(sensor_data_df.groupby("device_id"))
             # # Define a color scale for air quality - green for high quality, red for low
             air_quality_color_scale = [
                 (0.0, "red"),   # Air quality index 0
@@ -94,16 +134,16 @@ while True:
                     # Create a line chart for Temperature in Office 1
                     with col1:
                         fig1 = go.Figure()
-                        fig1.add_trace(go.Scatter(x=dates, y=temperature, mode='lines+markers', name='Temperature',
-                                                line=dict(shape='spline', smoothing=1.3, color='#1f77b4')))
+                        for device_id, device_df in devices:
+                            fig1.add_trace(go.Scatter(x=device_df["timestamp"], y=device_df["temperature"], mode='lines', name=device_id))
                         fig1.update_layout(title='Temperature', xaxis_title='Date', yaxis_title='Temperature (°C)', template="plotly_white")
                         st.plotly_chart(fig1, use_container_width=True)
                     
                     # Create a line chart for Humidity in Office 1
                     with col2:
                         fig2 = go.Figure()
-                        fig2.add_trace(go.Scatter(x=dates, y=humidity, mode='lines+markers', name='Humidity',
-                                                line=dict(shape='spline', smoothing=1.3, color='#ff7f0e')))
+                        for device_id, device_df in devices:
+                            fig2.add_trace(go.Scatter(x=device_df["timestamp"], y=device_df["humidity"], mode='lines', name=device_id))
                         fig2.update_layout(title='Humidity', xaxis_title='Date', yaxis_title='Humidity (%)', template="plotly_white")
                         st.plotly_chart(fig2, use_container_width=True)
                     
@@ -116,62 +156,155 @@ while True:
                 # Create a line chart for CO2 Level in Office 2
                 with col3:
                     fig3 = go.Figure()
-                    fig3.add_trace(go.Scatter(x=dates, y=co2_levels, mode='lines+markers', name='CO2 Level',
-                                            line=dict(shape='spline', smoothing=1.3, color='#2ca02c')))
+                    for device_id, device_df in devices:
+                        fig3.add_trace(go.Scatter(x=device_df["timestamp"], y=device_df["co2"], mode='lines', name=device_id))
                     fig3.update_layout(title='CO2 Level', xaxis_title='Date', yaxis_title='CO2 (PPM)', template="plotly_white")
                     st.plotly_chart(fig3, use_container_width=True)
                 
                 # Create a line chart for Air Quality in Office 2 with gradient color
                 with col4:
-                    fig4 = go.Figure(data=go.Scatter(
-                        x=dates,
-                        y=air_quality,
-                        mode='lines+markers',
-                        name='Air Quality',
-                        marker=dict(
-                            size=8,
-                            color=air_quality,  # Set color equal to a variable
-                            colorscale=air_quality_color_scale,  # Set the colorscale
-                            colorbar=dict(title='Air Quality'),
-                            showscale=True
-                        ),
-                        line=dict(shape='spline', smoothing=1.3)
-                    ))
+                    fig4 = go.Figure()
+                    for i, (device_id, device_df) in enumerate(devices):
+                        fig4.add_trace(go.Scatter(
+                            x=device_df["timestamp"],
+                            y=device_df["iaq"],
+                            mode='lines+markers',
+                            name=device_id,
+                            marker=dict(
+                                size=8,
+                                color=device_df["iaq"],  # Set color equal to a variable
+                                colorscale=air_quality_color_scale,  # Set the colorscale
+                                colorbar=dict(title='Air Quality'),
+                                showscale=i == 0  # A single colorbar for all devices
+                            )
+                        ))
                     fig4.update_layout(title='Air Quality', xaxis_title='Date', yaxis_title='AQI', template="plotly_white")
                     st.plotly_chart(fig4, use_container_width=True)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
-            # # Main container for Machine Learning Forecasting
-            with st.container():
-                st.subheader("Machine Learning Forecasting")
-                col5, col6 = st.columns(2)
-                
-                # Create a line chart for Daily Power Consumption with Forecasting
-                with col5:
-                    fig5 = go.Figure()
-                    # Actual Power Consumption
-                    fig5.add_trace(go.Scatter(x=[1,2,3,4,5,6], y=prediction_power_data, mode='lines+markers', name='Actual',
-                                            line=dict(color='blue')))
-                    # Forecasted Power Consumption
-                    fig5.add_trace(go.Scatter(x=[1,2,3,4,5,6], y=power_consumption , mode='lines', name='Forecast',
-                                            line=dict(color='orange')))
-                    fig5.update_layout(title='Daily Power Consumption Forecast', xaxis_title='Date', yaxis_title='Power (kW)', template="plotly_white")
-                    st.plotly_chart(fig5, use_container_width=True)
-                
-                # Create a line chart for Weather Forecasting
-                with col6:
-                    fig6 = go.Figure()
-                    fig6.add_trace(go.Scatter(x=[1,2,3,4,5,6], y=weather_data, mode='lines', name='Forecast',
-                                            fill='tozeroy', line=dict(color='skyblue')))
-                    fig6.update_layout(title='Weather Forecast', xaxis_title='Date', yaxis_title='Temperature (°C)', template="plotly_white")
-                    st.plotly_chart(fig6, use_container_width=True)
-                
-
         else:
             st.write("Waiting for sensor data...")
 
+def render_forecast_charts(prediction_power_df):
+    """Redraw the forecasting charts from the predicted consumption of every forecast day."""
+    with forecast_placeholder.container():
+        # # Main container for Machine Learning Forecasting
+        with st.container():
+            st.subheader("Machine Learning Forecasting")
+            if prediction_power_df.empty:
+                st.write("Waiting for the forecast...")
+                return
+            days = prediction_power_df["day"]
+            col5, col6 = st.columns(2)
+            
+            # Create a line chart for Daily Power Consumption with Forecasting
+            with col5:
+                fig5 = go.Figure()
+                # Forecasted Power Consumption
+                fig5.add_trace(go.Scatter(x=days, y=prediction_power_df["kwh"], mode='lines+markers', name='Forecast',
+                                        line=dict(color='orange')))
+                fig5.update_layout(title='Daily Power Consumption Forecast', xaxis_title='Day', yaxis_title='Power (kW)', template="plotly_white")
+                st.plotly_chart(fig5, use_container_width=True)
+            
+            # Create a line chart for Weather Forecasting
+            with col6:
+                fig6 = go.Figure()
+                fig6.add_trace(go.Scatter(x=days, y=prediction_power_df["temp"], mode='lines', name='Forecast',
+                                        fill='tozeroy', line=dict(color='skyblue')))
+                fig6.update_layout(title='Weather Forecast', xaxis_title='Day', yaxis_title='Temperature (°C)', template="plotly_white")
+                st.plotly_chart(fig6, use_container_width=True)
+
+def open_sensor_stream():
+    """Subscribe to the sensor data pushed by the backend; the rows are read with iter_sensor_events."""
+    url = "http://localhost:8000/stream_sensor_data"
+    response = requests.get(url, stream=True, timeout=(5, 60))
+    response.raise_for_status()
+    return response
+
+def iter_sensor_events(response):
+    """Yield the list of new rows of every server-sent event, and an empty list on every keepalive."""
+    data_lines = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif line.startswith(":"):
+            yield []
+        elif not line and data_lines:
+            yield json.loads("\n".join(data_lines))
+            data_lines = []
+
+def bucket_sensor_rows(rows_df):
+    """Average pushed rows into the buckets of the charts, keeping the number of rows of every bucket."""
+    rows_df = rows_df.assign(timestamp=rows_df["timestamp"] // CHART_RESOLUTION * CHART_RESOLUTION, samples=1)
+    grouped = rows_df.groupby(["device_id", "timestamp"])
+    buckets = grouped[CHART_FIELDS].mean()
+    buckets["samples"] = grouped["samples"].sum()
+    return buckets.reset_index()
+
+def append_sensor_rows(sensor_data_df, new_df):
+    """Fold new rows into the buckets of the charts and evict the buckets outside the displayed window.
+    A bucket that already holds rows is updated with the mean weighted by the number of rows, so the
+    buffer holds at most CHART_POINTS buckets per device however many rows are pushed.
+    Called once per redraw with all the rows received since the previous one, not once per event.
+    Return the buffer and whether it changed."""
+    if new_df.empty:
+        return sensor_data_df, False
+    buckets = pd.concat([sensor_data_df, bucket_sensor_rows(new_df)], ignore_index=True)
+    weighted = buckets[CHART_FIELDS].mul(buckets["samples"], axis=0)
+    weighted[["device_id", "timestamp", "samples"]] = buckets[["device_id", "timestamp", "samples"]]
+    merged = weighted.groupby(["device_id", "timestamp"], as_index=False).sum()
+    merged[CHART_FIELDS] = merged[CHART_FIELDS].div(merged["samples"], axis=0)
+    merged = merged[merged["timestamp"] >= int(time.time()) - WINDOW_SECONDS]
+    return merged.sort_values(["timestamp", "device_id"]).reset_index(drop=True)[["device_id", "timestamp", "samples"] + CHART_FIELDS], True
+
+# Placeholders for the stream status, the sensor charts and the forecast charts,
+# each one is only redrawn when its data changed
+status_placeholder = st.empty()
+sensor_data_placeholder = st.empty()
+forecast_placeholder = st.empty()
 
-    # Wait for 5 seconds before the next update
-    time.sleep(1)
+# The buffer of chart buckets survives the reruns of the script, so a rerun draws it right away
+if "sensor_buffer" not in st.session_state:
+    st.session_state.sensor_buffer = pd.DataFrame()
+render_sensor_charts(st.session_state.sensor_buffer)
 
+prediction_power_df = prediction_power()
+prediction_fetched_at = time.time()
+render_forecast_charts(prediction_power_df)
+
+while True:
+    try:
+        # Subscribe first, then fetch what was stored before, so no row falls in between;
+        # the buckets of the whole window are fetched again, they are few whatever the sample rate
+        stream = open_sensor_stream()
+        status_placeholder.empty()
+        chart_df = fetch_sensor_chart()
+        if not chart_df.empty:
+            st.session_state.sensor_buffer = chart_df
+            render_sensor_charts(st.session_state.sensor_buffer)
+
+        drawn_at = time.time()
+
+        with stream:
+            # The rows are pushed every second, the buffer and the charts are only updated every REDRAW_SECONDS
+            pending_rows = []
+            for rows in iter_sensor_events(stream):
+                pending_rows.extend(rows)
+                if pending_rows and time.time() - drawn_at >= REDRAW_SECONDS:
+                    st.session_state.sensor_buffer, changed = append_sensor_rows(st.session_state.sensor_buffer, pd.DataFrame(pending_rows))
+                    pending_rows = []
+                    if changed:
+                        render_sensor_charts(st.session_state.sensor_buffer)
+                    drawn_at = time.time()
+                # The prediction changes rarely, refresh it once a minute
+                if time.time() - prediction_fetched_at >= PREDICTION_REFRESH_SECONDS:
+                    new_prediction_df = prediction_power()
+                    prediction_fetched_at = time.time()
+                    if not new_prediction_df.equals(prediction_power_df):
+                        prediction_power_df = new_prediction_df
+                        render_forecast_charts(prediction_power_df)
+    except requests.exceptions.RequestException as e:
+        status_placeholder.warning(f"Live sensor stream interrupted, reconnecting: {e}")
 
+    # Wait before reconnecting to the stream
+    time.sleep(2)